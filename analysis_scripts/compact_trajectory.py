@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+'''
+compact_trajectory.py
+
+Convert a full-atom FD+IDR trajectory into a compact HDF5 archive that stores the
+fixed FD backbone heavy atoms once and everything else (IDR, FD side chains, which
+still get chi moves, hydrogens and ions) per frame. Ions are moved by
+FMCSC_RIGIDFREQ, so they are only stored once with --static-ions. Frame blocks
+are chunked and compressed, so single frames or frame ranges can be read without
+decompressing the whole file, and a full-atom mdtraj Trajectory can be rebuilt
+when needed. fd_idr_interface_contacts.py, motif_bound_state.py and
+convergence_check.py read these archives (.h5) in place of __traj.xtc through
+iter_compact.
+
+Archive layout:
+
+    /topology       text of the start PDB (__START.pdb), as gzipped bytes
+    /static_xyz     (n_atoms, 3) start coordinates for every atom (nm)
+    /mobile_atoms   (n_mobile,) indices of atoms stored per frame
+    /xyz            (n_frames, n_mobile, 3) mobile coordinates (nm)
+    /time           (n_frames,)
+    /unitcell_vectors (n_frames, 3, 3), only if present in the source
+
+Usage:
+
+> python compact_trajectory.py convert __START.pdb __traj.xtc fixed.txt --idr-first --out traj_compact.h5
+> python compact_trajectory.py extract traj_compact.h5 frames.xtc --frames 0 100 --full
+
+'''
+
+import os
+import argparse
+import tempfile
+import numpy as np
+import mdtraj as md
+import h5py
+from fd_idr_interface_contacts import read_fixed_residues, get_fd_idr_atoms, split_fd_atoms
+
+## --------------------- Functions --------------------- ##
+ION_RESIDUES = ['NA', 'CL', 'NA+', 'CL-', 'K', 'K+']
+
+
+def get_mobile_atoms(top, len_idr, idr_first=False, static_ions=False):
+    '''
+    Indices of the atoms that are stored every frame: everything except the
+    FD backbone heavy atoms and (if static_ions) the ions.
+    '''
+    fd_atoms, fd_atom_res, _, _ = get_fd_idr_atoms(top, len_idr, idr_first, heavy_only=False)
+    fd_static, _, _, _ = split_fd_atoms(top, fd_atoms, fd_atom_res)
+    static = set(fd_static.tolist())
+    if static_ions:
+        static.update(a.index for a in top.atoms if a.residue.name.upper() in ION_RESIDUES)
+
+    return np.array([a.index for a in top.atoms if a.index not in static], dtype=int)
+
+
+def write_compact(start_pdb, traj_file, out_file, idr_fixed, idr_first=False, static_ions=False,
+                  chunk=500, precision=3, compression_level=4, drift_tolerance=0.05):
+    '''
+    Stream traj_file into a compact archive. Coordinates are rounded to
+    `precision` decimal places in nm (3 matches the .xtc precision).
+
+    Raises an Exception if any static atom moves more than drift_tolerance nm
+    from __START.pdb, since those atoms would not be reconstructed correctly.
+    '''
+    start = md.load(start_pdb)
+    mobile = get_mobile_atoms(start.top, len(idr_fixed), idr_first, static_ions)
+    static = np.setdiff1d(np.arange(start.n_atoms), mobile)
+    n_mobile = len(mobile)
+
+    with open(start_pdb) as f:
+        pdb_text = f.read()
+
+    with h5py.File(out_file, 'w') as h5:
+        h5.create_dataset('topology', data=np.frombuffer(pdb_text.encode(), dtype=np.uint8), compression='gzip')
+        h5.create_dataset('static_xyz', data=start.xyz[0], compression='gzip')
+        h5.create_dataset('mobile_atoms', data=mobile)
+        xyz = h5.create_dataset('xyz', shape=(0, n_mobile, 3), maxshape=(None, n_mobile, 3),
+                                chunks=(min(chunk, 100), n_mobile, 3), dtype='f4', scaleoffset=precision,
+                                shuffle=True, compression='gzip', compression_opts=compression_level)
+        time = h5.create_dataset('time', shape=(0,), maxshape=(None,), dtype='f4', chunks=True)
+        cell = None
+
+        n_frames = 0
+        for block in md.iterload(traj_file, top=start_pdb, chunk=chunk):
+            drift = np.sqrt(np.sum((block.xyz[:, static] - start.xyz[0, static])**2, axis=2)).max()
+            if drift > drift_tolerance:
+                raise Exception(f'Static atoms moved {drift:.3f} nm from {start_pdb} in frames '
+                                f'{n_frames}-{n_frames + len(block) - 1}; refusing to drop them')
+
+            n_new = n_frames + len(block)
+            xyz.resize((n_new, n_mobile, 3))
+            xyz[n_frames:n_new] = block.xyz[:, mobile]
+            time.resize((n_new,))
+            time[n_frames:n_new] = block.time
+
+            if block.unitcell_vectors is not None:
+                if cell is None:
+                    cell = h5.create_dataset('unitcell_vectors', shape=(0, 3, 3), maxshape=(None, 3, 3),
+                                             dtype='f4', chunks=True, compression='gzip')
+                cell.resize((n_new, 3, 3))
+                cell[n_frames:n_new] = block.unitcell_vectors
+
+            n_frames = n_new
+
+        h5.attrs['source'] = os.path.basename(traj_file)
+        h5.attrs['n_frames'] = n_frames
+
+    return n_frames
+
+
+def _load_topology(h5):
+    # mdtraj only reads PDBs from disk, so round-trip the stored text through a temp file
+    pdb_text = h5['topology'][()].tobytes().decode()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.pdb', delete=False) as tmp:
+        tmp.write(pdb_text)
+    try:
+        return md.load(tmp.name).top
+    finally:
+        os.remove(tmp.name)
+
+
+def _read_frames(h5, frames):
+    # Mobile coordinates, time and unit cell for frames (None, a slice or indices)
+    n_frames = h5['xyz'].shape[0]
+    if frames is None:
+        frames = slice(0, n_frames)
+
+    if isinstance(frames, slice):
+        sel = np.arange(n_frames)[frames]
+        xyz = h5['xyz'][frames]
+    else:
+        # h5py fancy indexing needs sorted unique indices
+        sel = np.asarray(frames, dtype=int)
+        uniq, inverse = np.unique(sel, return_inverse=True)
+        xyz = h5['xyz'][uniq][inverse]
+
+    # Only read the span of frames covered by sel
+    lo, hi = (sel.min(), sel.max() + 1) if len(sel) else (0, 0)
+    time = h5['time'][lo:hi][sel - lo]
+    cell = h5['unitcell_vectors'][lo:hi][sel - lo] if 'unitcell_vectors' in h5 else None
+
+    return sel, xyz, time, cell
+
+
+def read_compact(archive, frames=None, full=False):
+    '''
+    Read frames from a compact archive as an mdtraj Trajectory.
+
+    frames may be None (all), a slice, or a list/array of frame indices in any
+    order. With full=False only the mobile atoms are returned (with a matching
+    subset topology); with full=True the static atoms are filled in from the
+    stored start coordinates to give a full-atom trajectory.
+    '''
+    with h5py.File(archive, 'r') as h5:
+        sel, xyz, time, cell = _read_frames(h5, frames)
+        mobile = h5['mobile_atoms'][()]
+        static_xyz = h5['static_xyz'][()]
+        top = _load_topology(h5)
+
+    if full:
+        full_xyz = np.repeat(static_xyz[None, :, :], len(sel), axis=0)
+        full_xyz[:, mobile] = xyz
+        traj = md.Trajectory(full_xyz, top, time=time)
+    else:
+        traj = md.Trajectory(xyz, top.subset(mobile), time=time)
+
+    if cell is not None:
+        traj.unitcell_vectors = cell
+
+    return traj
+
+
+def iter_compact(archive, chunk=500, stride=1, atom_indices=None):
+    '''
+    Stream a compact archive in blocks of `chunk` frames, like md.iterload.
+
+    atom_indices selects atoms of the full system (in the given order); static
+    atoms are filled in from the stored start coordinates. Each block only
+    decompresses the HDF5 chunks holding its frames.
+    '''
+    with h5py.File(archive, 'r') as h5:
+        n_frames = h5['xyz'].shape[0]
+        mobile = h5['mobile_atoms'][()]
+        static_xyz = h5['static_xyz'][()]
+        top = _load_topology(h5)
+
+        if atom_indices is None:
+            atom_indices = np.arange(top.n_atoms)
+        atom_indices = np.asarray(atom_indices, dtype=int)
+        top = top.subset(atom_indices)
+
+        # Column of each selected atom in /xyz, or -1 if it is static
+        col = np.full(len(static_xyz), -1, dtype=int)
+        col[mobile] = np.arange(len(mobile))
+        col = col[atom_indices]
+        is_mobile = col >= 0
+
+        for first in range(0, n_frames, chunk * stride):
+            frames = slice(first, min(first + chunk * stride, n_frames), stride)
+            _, xyz, time, cell = _read_frames(h5, frames)
+
+            block_xyz = np.repeat(static_xyz[None, atom_indices], len(xyz), axis=0)
+            block_xyz[:, is_mobile] = xyz[:, col[is_mobile]]
+            block = md.Trajectory(block_xyz, top, time=time)
+            if cell is not None:
+                block.unitcell_vectors = cell
+
+            yield block
+
+
+## --------------------- MAIN --------------------- ##
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compact FD+IDR trajectory archive (static FD stored once)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert = subparsers.add_parser('convert', help='convert a full-atom trajectory to a compact archive')
+    convert.add_argument('pdb', type=str, help='start PDB (__START.pdb) defining the fixed FD backbone coordinates')
+    convert.add_argument('traj', type=str, help='trajectory file (__traj.xtc)')
+    convert.add_argument('fixed_res_file', type=str, help='single line IDR fixed residues file')
+    convert.add_argument('--idr-first', action='store_true', help='flag if IDR is first chain in PDB')
+    convert.add_argument('--static-ions', action='store_true',
+                         help='store ions once, like the FD (only if ions were not moved, e.g. FMCSC_RIGIDFREQ 0)')
+    convert.add_argument('--precision', type=int, default=3,
+                         help='decimal places (nm) kept for stored coordinates (default=3, same as .xtc)')
+    convert.add_argument('--chunk', type=int, default=500, help='frames read per block (default=500)')
+    convert.add_argument('--out', type=str, default='traj_compact.h5', help='output archive')
+
+    extract = subparsers.add_parser('extract', help='write frames from a compact archive to a trajectory file')
+    extract.add_argument('archive', type=str, help='compact trajectory archive')
+    extract.add_argument('out', type=str, help='output trajectory (any format mdtraj can write)')
+    extract.add_argument('--frames', nargs=2, type=int, default=None, metavar=('START', 'STOP'),
+                         help='frame range to extract (default: all)')
+    extract.add_argument('--full', action='store_true', help='rebuild the full-atom system, including static atoms')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        idr_fixed = read_fixed_residues(args.fixed_res_file)
+        n_frames = write_compact(args.pdb, args.traj, args.out, idr_fixed, idr_first=args.idr_first,
+                                 static_ions=args.static_ions, chunk=args.chunk, precision=args.precision)
+        print(f'Wrote {n_frames} frames: {os.path.getsize(args.traj)/1e6:.1f} MB -> '
+              f'{os.path.getsize(args.out)/1e6:.1f} MB')
+
+    else:
+        frames = slice(*args.frames) if args.frames is not None else None
+        traj = read_compact(args.archive, frames=frames, full=args.full)
+        traj.save(args.out)
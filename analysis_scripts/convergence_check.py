@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+'''
+convergence_check.py
+
+Block-averaged, bootstrap-resampled uncertainties on the bound fraction and the
+FD x IDR contact frequencies of each variant, pooled across replicas and start
+modes (coil_start / helical_start), with a per-variant verdict:
+
+    converged            - uncertainties below target, replicas and start modes agree
+    needs N more steps   - replicas/start modes disagree or blocks are still correlated,
+                           so each replica has to run longer
+    needs N more replicas - replicas agree but the pooled uncertainty is above target
+
+Each replica is streamed once against the FD contact grid (see
+fd_idr_interface_contacts.py) in blocks of --block-frames frames, reusing the
+fd_grid.npz written into each variant directory at build time when present. The
+production steps behind each trajectory (PROD) are read from the replica's
+run_sims.py, so "more steps" verdicts scale with what was actually run. Bootstrap
+samples resample replicas within each start mode and then blocks within each
+chosen replica, all as one weighted matrix product.
+
+Usage:
+
+> python convergence_check.py ATF4_TAZ2 ATF4_L12A_TAZ2 --fixed-residues fixed_residues.txt --idr-first
+
+'''
+
+import os
+import sys
+import argparse
+import numpy as np
+from fd_idr_interface_contacts import iter_interface_blocks
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'setup_scripts'))
+from plan_campaign import parse_run_script
+
+## --------------------- Functions --------------------- ##
+START_MODES = ['coil_start', 'helical_start']
+
+
+def find_fixed_residues(variant_dir, fixed_res_file):
+    # Build directories are named ${idr_name}_${fd_name}; take the longest matching IDR name
+    variant_name = os.path.basename(os.path.normpath(variant_dir))
+    with open(fixed_res_file) as f:
+        lines = [x.strip().split() for x in f if x.strip()]
+
+    matches = [line for line in lines if variant_name.startswith(line[0] + '_')]
+    if len(matches) == 0:
+        raise Exception(f'No fixed residues found for {variant_name} in {fixed_res_file}')
+
+    return max(matches, key=lambda line: len(line[0]))[1]
+
+
+def find_replicas(variant_dir, traj_name='__traj.xtc'):
+    '''
+    Returns a list of (start_mode, replica_dir) for every replica with a trajectory.
+    '''
+    replicas = []
+    for mode in START_MODES:
+        mode_dir = os.path.join(variant_dir, mode)
+        if not os.path.isdir(mode_dir):
+            continue
+        rep_dirs = sorted([d for d in os.listdir(mode_dir) if d.isdigit()], key=int)
+        for d in rep_dirs:
+            if os.path.exists(os.path.join(mode_dir, d, traj_name)):
+                replicas.append((mode, os.path.join(mode_dir, d)))
+
+    return replicas
+
+
+def replica_prod_steps(rep_dir):
+    # PROD as written into run_sims.py by create_tsmc_run_script.py, or None if there is no script
+    run_script = os.path.join(rep_dir, 'run_sims.py')
+    if not os.path.exists(run_script):
+        return None
+
+    return parse_run_script(run_script)['prod']
+
+
+def replica_blocks(variant_dir, rep_dir, idr_fixed, block_frames, idr_first=False, traj_name='__traj.xtc',
+                   cutoff=4.5, fd_grid=None):
+    '''
+    Block means of the bound fraction (n_blocks,) and contact frequencies
+    (n_blocks, n_idr_res, n_fd_res) for one replica. A trailing partial block is dropped.
+    fd_grid optionally names a precomputed grid file passed to iter_interface_blocks.
+    '''
+    start_pdb = os.path.join(rep_dir, '__START.pdb')
+    if not os.path.exists(start_pdb):
+        start_pdb = os.path.join(variant_dir, '__START.pdb')
+
+    bound, contacts = [], []
+    for counts, _, block_bound in iter_interface_blocks(start_pdb, os.path.join(rep_dir, traj_name), idr_fixed,
+                                                        cutoff=cutoff, idr_first=idr_first, chunk=block_frames,
+                                                        fd_grid=fd_grid):
+        if len(block_bound) < block_frames:
+            break
+        bound.append(block_bound.mean())
+        contacts.append(counts / block_frames)
+
+    return np.array(bound), np.array(contacts)
+
+
+def bootstrap_weights(groups, n_blocks, n_boot, rng):
+    '''
+    Two-level bootstrap weights of shape (n_boot, n_reps * n_blocks).
+
+    Replicas are resampled with replacement within each group (start mode), then
+    blocks are resampled with replacement within every chosen replica. Row b of
+    the result counts how often each (replica, block) was drawn in sample b.
+    '''
+    n_reps = sum(len(g) for g in groups)
+    rep_idx = np.concatenate([np.asarray(g)[rng.integers(0, len(g), size=(n_boot, len(g)))] for g in groups],
+                             axis=1)
+    block_idx = rng.integers(0, n_blocks, size=(n_boot, n_reps, n_blocks))
+
+    flat = rep_idx[:, :, None] * n_blocks + block_idx
+    rows = np.arange(n_boot)[:, None, None] * (n_reps * n_blocks)
+    W = np.bincount((rows + flat).ravel(), minlength=n_boot * n_reps * n_blocks)
+
+    return W.reshape(n_boot, n_reps * n_blocks)
+
+
+def block_bootstrap(values, groups, n_boot=1000, seed=None):
+    '''
+    Bootstrap means of values (n_reps, n_blocks, ...). Returns (n_boot, ...).
+    '''
+    rng = np.random.default_rng(seed)
+    n_reps, n_blocks = values.shape[:2]
+    W = bootstrap_weights(groups, n_blocks, n_boot, rng)
+    boot = W @ values.reshape(n_reps * n_blocks, -1) / (n_reps * n_blocks)
+
+    return boot.reshape((n_boot,) + values.shape[2:])
+
+
+def replica_consistency(block_means, block_frames=1):
+    '''
+    Reduced chi-squared of the per-replica means around the pooled mean, using
+    each replica's block standard error. Values well above 1 mean the replicas
+    are sampling different states.
+    '''
+    n_reps, n_blocks = block_means.shape
+    if n_reps < 2:
+        return 0.0
+
+    means = block_means.mean(axis=1)
+    se2 = block_means.var(axis=1, ddof=1) / n_blocks
+    # Floor the standard error at one flipped frame in the replica, 1 / (n_blocks * block_frames),
+    # the resolution of a replica mean, so identical replicas are not divided by 0
+    se2 = np.maximum(se2, 1.0 / (n_blocks * block_frames)**2)
+
+    return float(np.sum((means - means.mean())**2 / se2) / (n_reps - 1))
+
+
+def block_correlation_ratio(block_means):
+    '''
+    Ratio of the standard error from blocks twice as long to the one from the
+    current blocks. Close to 1 once blocks are longer than the correlation time.
+    '''
+    n_reps, n_blocks = block_means.shape
+    if n_blocks < 4:
+        return np.inf
+
+    n_pairs = n_blocks // 2
+    merged = block_means[:, :2 * n_pairs].reshape(n_reps, n_pairs, 2).mean(axis=2)
+
+    se = block_means.std(ddof=1) / np.sqrt(block_means.size)
+    se_merged = merged.std(ddof=1) / np.sqrt(merged.size)
+    if se == 0:
+        return 1.0 if se_merged == 0 else np.inf
+
+    return float(se_merged / se)
+
+
+def convergence_verdict(bound_blocks, contact_blocks, modes, prod_steps, target_se=0.05, target_contact_se=0.05,
+                        max_chi2=3.0, max_corr_ratio=1.25, n_boot=1000, seed=None, block_frames=100):
+    '''
+    Uncertainties and verdict for one variant from per-replica block means.
+
+    bound_blocks is (n_reps, n_blocks), contact_blocks (n_reps, n_blocks, n_idr, n_fd)
+    and modes the start mode of each replica. block_frames is the number of
+    frames averaged in each block.
+    '''
+    modes = np.asarray(modes)
+    groups = [np.nonzero(modes == m)[0] for m in START_MODES if np.any(modes == m)]
+
+    boot_bound = block_bootstrap(bound_blocks, groups, n_boot=n_boot, seed=seed)
+    boot_contacts = block_bootstrap(contact_blocks, groups, n_boot=n_boot, seed=seed)
+
+    res = {'n_reps': len(modes), 'n_blocks': bound_blocks.shape[1],
+           'bound_fraction': float(bound_blocks.mean()),
+           'bound_se': float(boot_bound.std()),
+           'max_contact_se': float(boot_contacts.std(axis=0).max()),
+           'chi2': replica_consistency(bound_blocks, block_frames),
+           'corr_ratio': block_correlation_ratio(bound_blocks)}
+
+    # Coil and helical starts must agree within their combined uncertainty
+    mode_disagree = False
+    if len(groups) == 2:
+        mode_means = [bound_blocks[g].mean() for g in groups]
+        mode_se = [block_bootstrap(bound_blocks[g], [np.arange(len(g))], n_boot=n_boot, seed=seed).std()
+                   for g in groups]
+        mode_disagree = abs(mode_means[0] - mode_means[1]) > 2 * np.sqrt(mode_se[0]**2 + mode_se[1]**2)
+
+    # Statistical error falls as 1/sqrt(sampling), so this is the factor of extra sampling needed
+    factor = max((res['bound_se'] / target_se)**2, (res['max_contact_se'] / target_contact_se)**2)
+
+    if mode_disagree or res['chi2'] > max_chi2 or res['corr_ratio'] > max_corr_ratio:
+        extra = int(np.ceil(prod_steps * (max(factor, 2.0) - 1) / 1e6) * 1e6)
+        res['verdict'] = 'more_steps'
+        res['detail'] = f'needs {extra} more steps per replica'
+    elif factor > 1:
+        reps_per_mode = int(np.ceil(len(modes) / len(groups)))
+        extra = int(np.ceil(reps_per_mode * (factor - 1)))
+        res['verdict'] = 'more_replicas'
+        res['detail'] = f'needs {extra} more replicas per start mode'
+    else:
+        res['verdict'] = 'converged'
+        res['detail'] = 'converged'
+
+    return res
+
+
+## --------------------- MAIN --------------------- ##
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Block bootstrap uncertainties and convergence verdicts per variant')
+    parser.add_argument('variant_dirs', nargs='+', help='variant build directories (containing coil_start/helical_start)')
+    parser.add_argument('--fixed-residues', type=str, required=True,
+                        help='fixed IDR residues file used for the build (one line per IDR)')
+    parser.add_argument('--idr-first', action='store_true', help='flag if IDR is first chain in PDB')
+    parser.add_argument('--block-frames', type=int, default=100,
+                        help='frames per block (default=100, i.e. 1M steps at FMCSC_XYZOUT 10000 in run.key)')
+    parser.add_argument('--prod-steps', type=int, default=None,
+                        help='production steps per replica (PROD); default is read from each replica\'s run_sims.py')
+    parser.add_argument('--target-se', type=float, default=0.05,
+                        help='target standard error on the bound fraction (default=0.05)')
+    parser.add_argument('--target-contact-se', type=float, default=0.05,
+                        help='target standard error on every contact frequency (default=0.05)')
+    parser.add_argument('--n-boot', type=int, default=1000, help='number of bootstrap samples (default=1000)')
+    parser.add_argument('--cutoff', type=float, default=4.5,
+                        help='heavy atom contact distance in Angstroms (default=4.5)')
+    parser.add_argument('--fd-grid', type=str, default='fd_grid.npz',
+                        help='precomputed FD grid file name in each variant directory, used if present '
+                             '(default=fd_grid.npz, as linked by the build script)')
+    parser.add_argument('--traj-name', type=str, default='__traj.xtc',
+                        help='trajectory file name in each replica (default=__traj.xtc, or a compact .h5 archive)')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for the bootstrap')
+    parser.add_argument('--out', type=str, default='convergence_summary.txt', help='output file')
+    args = parser.parse_args()
+
+    out_str = '# variant n_reps n_blocks bound_fraction bound_se max_contact_se chi2 corr_ratio verdict detail\n'
+    for variant_dir in args.variant_dirs:
+        name = os.path.basename(os.path.normpath(variant_dir))
+        idr_fixed = find_fixed_residues(variant_dir, args.fixed_residues)
+        replicas = find_replicas(variant_dir, args.traj_name)
+        if len(replicas) == 0:
+            print(f'No trajectories found for {name}, skipping...')
+            continue
+
+        prod_steps = args.prod_steps
+        if prod_steps is None:
+            # Replicas extended by hand may differ; scale from the longest one
+            prods = [p for p in (replica_prod_steps(rep_dir) for _, rep_dir in replicas) if p is not None]
+            if len(prods) == 0:
+                print(f'No run_sims.py found for {name} (pass --prod-steps), skipping...')
+                continue
+            prod_steps = max(prods)
+
+        fd_grid = os.path.join(variant_dir, args.fd_grid)
+        if not os.path.exists(fd_grid):
+            fd_grid = None
+
+        modes, bound_blocks, contact_blocks = [], [], []
+        for mode, rep_dir in replicas:
+            bound, contacts = replica_blocks(variant_dir, rep_dir, idr_fixed, args.block_frames,
+                                             idr_first=args.idr_first, traj_name=args.traj_name,
+                                             cutoff=args.cutoff, fd_grid=fd_grid)
+            modes.append(mode)
+            bound_blocks.append(bound)
+            contact_blocks.append(contacts)
+
+        # Replicas must share a block count for the stacked bootstrap; use the shortest
+        n_blocks = min(len(b) for b in bound_blocks)
+        if n_blocks < 2:
+            print(f'Fewer than 2 complete blocks for {name}, skipping...')
+            continue
+        bound_blocks = np.array([b[:n_blocks] for b in bound_blocks])
+        contact_blocks = np.array([c[:n_blocks] for c in contact_blocks])
+
+        res = convergence_verdict(bound_blocks, contact_blocks, modes, prod_steps,
+                                  target_se=args.target_se, target_contact_se=args.target_contact_se,
+                                  n_boot=args.n_boot, seed=args.seed, block_frames=args.block_frames)
+
+        line = (f"{name} {res['n_reps']} {res['n_blocks']} {res['bound_fraction']:.4f} {res['bound_se']:.4f} "
+                f"{res['max_contact_se']:.4f} {res['chi2']:.2f} {res['corr_ratio']:.2f} {res['verdict']} "
+                f"\"{res['detail']}\"")
+        print(line)
+        out_str += line + '\n'
+
+    with open(args.out, 'w') as out:
+        out.write(out_str)
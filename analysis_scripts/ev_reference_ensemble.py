@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+
+'''
+ev_reference_ensemble.py
+
+Fast excluded-volume (EV) reference ensemble for the flexible IDR flanks around a
+fixed motif, as a laptop-scale alternative to a full CAMPARI MC_MODE=ev campaign.
+
+The motif residues keep their __START.pdb CA positions. Each flank is grown one
+residue (CA bead, 3.8 A bonds, CA-CA-CA virtual angle 85-150 degrees) at a time
+outward from the motif anchor, for a whole batch of conformations in parallel.
+Trial positions that clash with the rigid FD (one lookup in a precomputed voxel
+mask of the FD excluded volume) or with any other bead are rejected, and each
+conformation carries its Rosenbluth weight. Plain Rosenbluth weights collapse onto
+a few chains for long flanks, so the batch is resampled (low weights pruned, high
+weights enriched) whenever its effective sample size (ESS) drops below
+--resample-ess of the batch. The ESS and the number of surviving lineages are
+reported per flank.
+
+Outputs per-residue FD x IDR contact frequencies and the IDR end-to-end distance
+and radius of gyration per conformation. With only CA beads, contacts are CA bead
+to FD CA within --contact-cutoff (8 A, as for dres.in), not the default heavy
+atom 4.5 A definition of fd_idr_interface_contacts.py. Run that script with
+--ca-only for simulation contact matrices that compare directly with these.
+
+Usage:
+
+> python ev_reference_ensemble.py __START.pdb fixed.txt --idr-first --n-conf 5000 --out-prefix ev
+
+'''
+
+import argparse
+import numpy as np
+import mdtraj as md
+from fd_idr_interface_contacts import read_fixed_residues, get_fd_idr_atoms, build_fd_grid, query_fd_grid
+
+## --------------------- Functions --------------------- ##
+BOND_LENGTH = 3.8
+# Turning angle between successive bonds (180 - CA-CA-CA virtual angle of 150 to 85 degrees)
+MIN_TURN, MAX_TURN = np.radians(30.0), np.radians(95.0)
+
+
+def build_clash_mask(fd_xyz, cutoff, spacing=0.5):
+    '''
+    Boolean voxel mask of the FD excluded volume: voxels whose centre is within
+    cutoff of any FD atom. Clash tests are then one lookup per point, accurate
+    to half a voxel diagonal (0.43 A at the default spacing).
+    '''
+    origin = fd_xyz.min(axis=0) - cutoff - spacing
+    shape = np.ceil((fd_xyz.max(axis=0) + cutoff + spacing - origin) / spacing).astype(int) + 1
+
+    r = int(np.ceil(cutoff / spacing))
+    offsets = np.stack(np.meshgrid(*[np.arange(-r, r + 1)] * 3, indexing='ij'), axis=-1).reshape(-1, 3)
+
+    # Voxel centres around each atom, kept if within the cutoff
+    atom_cell = np.floor((fd_xyz - origin) / spacing).astype(int)
+    cells = (atom_cell[:, None, :] + offsets[None, :, :]).reshape(-1, 3)
+    atom = np.repeat(np.arange(len(fd_xyz)), len(offsets))
+    centres = origin + (cells + 0.5) * spacing
+    near = np.sum((centres - fd_xyz[atom])**2, axis=1) < cutoff**2
+
+    mask = np.zeros(shape, dtype=bool)
+    mask[tuple(cells[near].T)] = True
+
+    return {'origin': origin, 'spacing': spacing, 'mask': mask}
+
+
+def fd_clashes(clash_mask, xyz):
+    # True for every point (n, 3) inside the FD excluded volume
+    cell = np.floor((xyz - clash_mask['origin']) / clash_mask['spacing']).astype(int)
+    shape = np.array(clash_mask['mask'].shape)
+    inside = np.all((cell >= 0) & (cell < shape), axis=1)
+
+    out = np.zeros(len(xyz), dtype=bool)
+    out[inside] = clash_mask['mask'][tuple(cell[inside].T)]
+    return out
+
+
+def trial_directions(prev_bond, n_trials, rng):
+    '''
+    Random unit vectors (n_conf, n_trials, 3) at an allowed turning angle from
+    each conformation's previous bond direction (n_conf, 3).
+    '''
+    u = prev_bond / np.linalg.norm(prev_bond, axis=1, keepdims=True)
+
+    # Orthonormal frame around u; use x as helper unless u is nearly parallel to it
+    helper = np.where(np.abs(u[:, :1]) < 0.9, np.array([[1.0, 0, 0]]), np.array([[0, 1.0, 0]]))
+    e1 = np.cross(u, helper)
+    e1 /= np.linalg.norm(e1, axis=1, keepdims=True)
+    e2 = np.cross(u, e1)
+
+    shape = (len(u), n_trials, 1)
+    cos_t = rng.uniform(np.cos(MAX_TURN), np.cos(MIN_TURN), size=shape)
+    sin_t = np.sqrt(1 - cos_t**2)
+    phi = rng.uniform(0, 2 * np.pi, size=shape)
+
+    return cos_t * u[:, None] + sin_t * (np.cos(phi) * e1[:, None] + np.sin(phi) * e2[:, None])
+
+
+def effective_sample_size(log_w):
+    # Kish effective sample size of unnormalized log weights (-inf for dead chains)
+    if not np.any(np.isfinite(log_w)):
+        return 0.0
+    w = np.exp(log_w - log_w.max())
+    return float(w.sum()**2 / np.sum(w**2))
+
+
+def resample(log_w, rng):
+    '''
+    Systematic resampling: indices (n,) drawn with probability proportional to
+    exp(log_w), so low-weight and dead chains are pruned and high-weight chains
+    enriched. The new chains all carry the mean weight, which keeps weights
+    comparable between batches.
+    '''
+    n = len(log_w)
+    w = np.exp(log_w - log_w.max())
+    idx = np.searchsorted(np.cumsum(w / w.sum()), (rng.random() + np.arange(n)) / n)
+    log_mean = log_w.max() + np.log(w.mean())
+
+    return np.minimum(idx, n - 1), np.full(n, log_mean)
+
+
+def grow_flank(beads, placed, order, clash_mask, rng, log_w, n_trials=16, bead_clash=4.0, resample_ess=0.5):
+    '''
+    Grow the residues in `order` (outward from the motif) for every conformation.
+
+    beads is (n_conf, n_idr, 3) with the positions in `placed` (bool, n_idr)
+    already set; it is filled (and reordered by resampling) in place. log_w holds
+    the incoming log Rosenbluth weights (n_conf,). Whenever the effective sample
+    size drops below resample_ess * n_conf the batch is resampled.
+
+    Returns (log_w, n_lineages), with -inf weights for conformations where every
+    trial failed and n_lineages the number of conformations entering the flank
+    that still have descendants.
+    '''
+    n_conf = len(beads)
+    log_w = log_w.copy()
+    lineage = np.arange(n_conf)
+    # +1 when growing towards the N-terminus (anchor is the next residue), -1 otherwise
+    step = 1 if order[0] + 1 < len(placed) and placed[order[0] + 1] else -1
+
+    for res in order:
+        anchor = res + step
+        prev_bond = beads[:, anchor] - beads[:, anchor + step]
+        trials = beads[:, anchor][:, None] + BOND_LENGTH * trial_directions(prev_bond, n_trials, rng).astype(np.float32)
+
+        # Clash with the rigid FD
+        ok = ~fd_clashes(clash_mask, trials.reshape(-1, 3)).reshape(n_conf, n_trials)
+
+        # Clash with every placed bead except the one it is bonded to
+        others = placed.copy()
+        others[anchor] = False
+        if np.any(others):
+            # |t - b|^2 = |t|^2 + |b|^2 - 2 t.b, with t.b as one batched matmul
+            b = beads[:, others]
+            d2 = (np.sum(trials**2, axis=2)[:, :, None] + np.sum(b**2, axis=2)[:, None, :]
+                  - 2 * trials @ b.transpose(0, 2, 1))
+            ok &= d2.min(axis=2) >= bead_clash**2
+
+        # Pick uniformly among the valid trials; weight by the fraction that were valid
+        n_ok = ok.sum(axis=1)
+        with np.errstate(divide='ignore'):
+            log_w += np.log(n_ok / n_trials)
+        pick = np.argmax(ok * rng.random(ok.shape), axis=1)
+        beads[:, res] = trials[np.arange(n_conf), pick]
+        placed[res] = True
+
+        if not np.any(np.isfinite(log_w)):
+            break
+        if effective_sample_size(log_w) < resample_ess * n_conf:
+            idx, log_w = resample(log_w, rng)
+            beads[:] = beads[idx]
+            lineage = lineage[idx]
+
+    n_lineages = len(np.unique(lineage[np.isfinite(log_w)]))
+    return log_w, n_lineages
+
+
+def grow_ensemble(motif_ca, idr_fixed, clash_mask, n_conf, rng, batch_size=1000, n_trials=16, bead_clash=4.0,
+                  resample_ess=0.5):
+    '''
+    Grow both flanks for n_conf conformations in batches, with resampling
+    (see grow_flank) so the weights do not collapse onto a few chains.
+
+    motif_ca is (n_idr, 3) with valid CA positions wherever idr_fixed is '1'.
+    Returns beads (n_conf, n_idr, 3), normalized weights (n_conf,) and a dict
+    of per-flank statistics ({flank: (ess, n_lineages)}): the ESS of all batches
+    once that flank is grown, and the lineages surviving it, summed over batches.
+    Conformations that failed to grow are dropped and regrown.
+    '''
+    n_idr = len(idr_fixed)
+    motif_start = idr_fixed.find('1')
+    motif_end = idr_fixed.rfind('1')
+    if motif_end - motif_start < 1:
+        raise Exception('Need at least two fixed (motif) residues to anchor the flanks')
+
+    flanks = []
+    if motif_start > 0:
+        flanks.append(('N-flank', np.arange(motif_start - 1, -1, -1)))
+    if motif_end < n_idr - 1:
+        flanks.append(('C-flank', np.arange(motif_end + 1, n_idr)))
+
+    all_beads, all_log_w = [], []
+    flank_log_w = {name: [] for name, _ in flanks}
+    flank_lineages = {name: 0 for name, _ in flanks}
+    n_done, n_tried = 0, 0
+    while n_done < n_conf:
+        n_batch = min(batch_size, n_conf - n_done)
+        beads = np.zeros((n_batch, n_idr, 3), dtype=np.float32)
+        placed = np.zeros(n_idr, dtype=bool)
+        beads[:, motif_start:motif_end + 1] = motif_ca[motif_start:motif_end + 1]
+        placed[motif_start:motif_end + 1] = True
+
+        # Weights carry across flanks, so resampling in the second flank also sees the first
+        log_w = np.zeros(n_batch)
+        for name, order in flanks:
+            log_w, n_lineages = grow_flank(beads, placed, order, clash_mask, rng, log_w,
+                                           n_trials, bead_clash, resample_ess)
+            flank_log_w[name].append(log_w)
+            flank_lineages[name] += n_lineages
+            if not np.any(np.isfinite(log_w)):
+                break
+
+        ok = np.isfinite(log_w)
+        all_beads.append(beads[ok])
+        all_log_w.append(log_w[ok])
+        n_done += int(ok.sum())
+        n_tried += n_batch
+        if n_tried > 20 * n_conf and n_done < n_conf:
+            raise Exception(f'Only {n_done} of {n_tried} conformations could be grown; flanks too crowded')
+
+    beads = np.concatenate(all_beads)
+    log_w = np.concatenate(all_log_w)
+    w = np.exp(log_w - log_w.max())
+
+    stats = {name: (effective_sample_size(np.concatenate(flank_log_w[name])), flank_lineages[name])
+             for name, _ in flanks}
+
+    return beads, w / w.sum(), stats
+
+
+def polymer_observables(beads):
+    ree = np.linalg.norm(beads[:, -1] - beads[:, 0], axis=1)
+    rg = np.sqrt(np.mean(np.sum((beads - beads.mean(axis=1, keepdims=True))**2, axis=2), axis=1))
+    return ree, rg
+
+
+def ev_contacts(beads, weights, fd_ca_grid):
+    '''
+    Weighted per-residue contact frequencies (n_idr, n_fd_res) between IDR beads
+    and FD CA atoms within the grid cutoff.
+    '''
+    n_conf, n_idr, _ = beads.shape
+    n_fd_res = fd_ca_grid['n_res']
+
+    q_idx, fd_idx = query_fd_grid(fd_ca_grid, beads.reshape(-1, 3))
+    conf = q_idx // n_idr
+    keys = np.unique((conf * n_idr + q_idx % n_idr) * n_fd_res + fd_ca_grid['atom_res'][fd_idx])
+    conf = keys // (n_idr * n_fd_res)
+    pair = keys % (n_idr * n_fd_res)
+
+    freq = np.bincount(pair, weights=weights[conf], minlength=n_idr * n_fd_res)
+    return freq.reshape(n_idr, n_fd_res)
+
+
+## --------------------- MAIN --------------------- ##
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='NumPy chain-growth EV reference ensemble for anchored IDR flanks')
+    parser.add_argument('pdb', type=str, help='start PDB (__START.pdb) with the motif bound to the FD')
+    parser.add_argument('fixed_res_file', type=str, help='single line IDR fixed residues file')
+    parser.add_argument('--idr-first', action='store_true', help='flag if IDR is first chain in PDB')
+    parser.add_argument('--n-conf', type=int, default=5000, help='number of conformations (default=5000)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='conformations grown in parallel (default=1000)')
+    parser.add_argument('--n-trials', type=int, default=16, help='trial positions per residue (default=16)')
+    parser.add_argument('--fd-clash', type=float, default=3.0,
+                        help='minimum bead to FD heavy atom distance in Angstroms (default=3.0)')
+    parser.add_argument('--bead-clash', type=float, default=4.0,
+                        help='minimum non-bonded bead to bead distance in Angstroms (default=4.0)')
+    parser.add_argument('--contact-cutoff', type=float, default=8.0,
+                        help='bead to FD CA contact distance in Angstroms (default=8.0)')
+    parser.add_argument('--resample-ess', type=float, default=0.5,
+                        help='resample a batch when its ESS falls below this fraction of the batch (default=0.5)')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    parser.add_argument('--out-prefix', type=str, default='ev', help='prefix for output files')
+    args = parser.parse_args()
+
+    idr_fixed = read_fixed_residues(args.fixed_res_file)
+    start = md.load(args.pdb)
+    top = start.top
+    xyz = start.xyz[0] * 10
+    fd_atoms, fd_atom_res, idr_atoms, idr_atom_res = get_fd_idr_atoms(top, len(idr_fixed), args.idr_first)
+
+    fd_ca = np.array([i for i, a in enumerate(fd_atoms) if top.atom(a).name == 'CA'], dtype=int)
+    idr_ca = np.array([a for a in idr_atoms if top.atom(a).name == 'CA'], dtype=int)
+
+    # Motif bead positions; flank positions are ignored and regrown
+    motif_ca = np.zeros((len(idr_fixed), 3))
+    motif_ca[idr_atom_res[np.isin(idr_atoms, idr_ca)]] = xyz[idr_ca]
+
+    clash_mask = build_clash_mask(xyz[fd_atoms], args.fd_clash)
+    contact_grid = build_fd_grid(xyz[fd_atoms[fd_ca]], fd_atom_res[fd_ca], args.contact_cutoff)
+
+    rng = np.random.default_rng(args.seed)
+    beads, weights, stats = grow_ensemble(motif_ca, idr_fixed, clash_mask, args.n_conf, rng,
+                                          batch_size=args.batch_size, n_trials=args.n_trials,
+                                          bead_clash=args.bead_clash, resample_ess=args.resample_ess)
+
+    ree, rg = polymer_observables(beads)
+    contacts = ev_contacts(beads, weights, contact_grid)
+
+    np.savetxt(f'{args.out_prefix}_contact_frequencies.txt', contacts, fmt='%.4f',
+               header=f'EV FD x IDR contact frequencies (IDR CA bead to FD CA within {args.contact_cutoff} A) '
+                      f'over {len(beads)} weighted conformations (rows: IDR residues, columns: FD residues)')
+
+    with open(f'{args.out_prefix}_polymer.txt', 'w') as out:
+        out.write('# conformation weight end_to_end_distance radius_of_gyration\n')
+        for i in range(len(beads)):
+            out.write(f'{i} {weights[i]:.6e} {ree[i]:.3f} {rg[i]:.3f}\n')
+
+    for name, (ess, n_lineages) in stats.items():
+        print(f'{name}: ESS {ess:.0f}, {n_lineages} surviving lineages')
+    n_eff = 1.0 / np.sum(weights**2)
+    print(f'{len(beads)} conformations (effective sample size {n_eff:.0f})')
+    print(f'<Ree> = {np.sum(weights * ree):.2f} A, <Rg> = {np.sum(weights * rg):.2f} A')
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+
+'''
+fd_idr_interface_contacts.py
+
+Per-residue FD x IDR contact frequencies and bound/unbound state for a FD+IDR
+trajectory. The FD backbone is held fixed in these simulations (every FD residue
+gets the "fixed" line in PSWFILE.psw), so a spatial grid of FD backbone heavy
+atoms is built once from __START.pdb. FD side chains still get chi moves
+(FMCSC_CHIFREQ), so FD side-chain heavy atoms are read every frame along with the
+IDR atoms and matched against them per block. Every static backbone atom is
+checked for drift from __START.pdb.
+
+A frame is bound if any fixed (motif) IDR residue contacts the FD (see
+motif_contact_counts); motif_bound_state.py uses the same definition.
+
+With --ca-only, contacts are IDR CA to FD CA within 8 A instead, the definition
+used by ev_reference_ensemble.py, so simulation and EV reference contact
+matrices can be compared directly. CA atoms are all static or per-frame IDR
+atoms, so no FD side chains are read in this mode.
+
+Usage:
+
+> python fd_idr_interface_contacts.py __START.pdb __traj.xtc fixed.txt --idr-first --out-prefix interface
+> python fd_idr_interface_contacts.py __START.pdb __traj.xtc fixed.txt --idr-first --ca-only --out-prefix interface_ca
+
+The trajectory may also be a compact archive (.h5) from compact_trajectory.py.
+
+'''
+
+import os
+import sys
+import argparse
+import numpy as np
+import mdtraj as md
+
+## --------------------- Functions --------------------- ##
+CAP_RESIDUES = ['ACE', 'NME']
+
+# FD atoms that no move type changes (the fixed PSW line only allows chi moves)
+FD_BACKBONE_ATOMS = ['N', 'CA', 'C', 'O', 'OXT']
+
+# All 27 neighbouring cell offsets (including the cell itself)
+CELL_OFFSETS = np.array([[i, j, k] for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)], dtype=int)
+
+
+def read_fixed_residues(fixed_res_file):
+    # Same single line format used by create_psw_file.py and create_restraint_file.py
+    with open(fixed_res_file) as f:
+        lines = [x.strip().split() for x in f]
+    return lines[0][1]
+
+
+def get_fd_idr_atoms(top, len_idr, idr_first=False, heavy_only=True):
+    '''
+    Split the protein atoms of a CAMPARI topology into FD and IDR atoms.
+
+    Caps and ions are skipped, then the first (--idr-first) or last len_idr
+    residues are taken as the IDR, exactly as in create_restraint_file.py.
+
+    Returns (fd_atoms, fd_atom_res, idr_atoms, idr_atom_res) where the *_res
+    arrays hold the 0-indexed residue number within each chain.
+    '''
+    residues = [r for r in top.residues if r.is_protein and r.name not in CAP_RESIDUES]
+    len_fd = len(residues) - len_idr
+    if len_fd <= 0:
+        raise Exception(f'Topology has {len(residues)} protein residues, but IDR has {len_idr}')
+
+    if idr_first:
+        idr_residues = residues[:len_idr]
+        fd_residues = residues[len_idr:]
+    else:
+        fd_residues = residues[:len_fd]
+        idr_residues = residues[len_fd:]
+
+    def _atoms(chain_residues):
+        atoms, atom_res = [], []
+        for i, res in enumerate(chain_residues):
+            for atom in res.atoms:
+                if heavy_only and atom.element is not None and atom.element.symbol == 'H':
+                    continue
+                atoms.append(atom.index)
+                atom_res.append(i)
+        return np.array(atoms, dtype=int), np.array(atom_res, dtype=int)
+
+    fd_atoms, fd_atom_res = _atoms(fd_residues)
+    idr_atoms, idr_atom_res = _atoms(idr_residues)
+
+    return fd_atoms, fd_atom_res, idr_atoms, idr_atom_res
+
+
+def split_fd_atoms(top, fd_atoms, fd_atom_res):
+    '''
+    Split FD atoms into the static backbone and the side chains moved by chi moves.
+
+    Returns (static_atoms, static_res, side_atoms, side_res).
+    '''
+    static = np.array([top.atom(a).name in FD_BACKBONE_ATOMS for a in fd_atoms], dtype=bool)
+    return fd_atoms[static], fd_atom_res[static], fd_atoms[~static], fd_atom_res[~static]
+
+
+def build_fd_grid(fd_xyz, fd_atom_res, cutoff):
+    '''
+    Bin the (rigid) FD atom coordinates into cubic cells of edge length cutoff.
+
+    Atoms are sorted by cell so each cell is a contiguous slice given by
+    starts[cell]:starts[cell]+counts[cell]. Coordinates in Angstroms.
+    '''
+    fd_xyz = np.asarray(fd_xyz, dtype=float)
+    origin = fd_xyz.min(axis=0) - cutoff
+    shape = np.floor((fd_xyz.max(axis=0) + cutoff - origin) / cutoff).astype(int) + 1
+
+    cells = np.floor((fd_xyz - origin) / cutoff).astype(int)
+    flat = np.ravel_multi_index(cells.T, shape)
+    order = np.argsort(flat, kind='stable')
+
+    counts = np.bincount(flat, minlength=int(np.prod(shape)))
+    starts = np.cumsum(counts) - counts
+
+    return {'origin': origin, 'shape': shape, 'cutoff': float(cutoff),
+            'xyz': fd_xyz[order], 'atom_res': np.asarray(fd_atom_res)[order],
+            'n_res': int(np.max(fd_atom_res)) + 1,
+            'starts': starts, 'counts': counts, 'order': order}
+
+
+def save_fd_grid(grid, fname):
+    np.savez(fname, **grid)
+
+
+def load_fd_grid(fname, fd_xyz, fd_atom_res, cutoff, tolerance=0.01):
+    '''
+    Load a grid written by save_fd_grid if it was built from these FD atoms.
+
+    Returns None if the cutoff, atom count, residue assignment or any coordinate
+    (beyond tolerance, Angstroms) differs, in which case the grid must be rebuilt.
+    '''
+    with np.load(fname) as data:
+        grid = {key: data[key] for key in data.files}
+    grid['cutoff'] = float(grid['cutoff'])
+    grid['n_res'] = int(grid['n_res'])
+
+    fd_xyz = np.asarray(fd_xyz, dtype=float)
+    if grid['cutoff'] != float(cutoff) or len(grid['order']) != len(fd_xyz):
+        return None
+    if not np.array_equal(grid['atom_res'], np.asarray(fd_atom_res)[grid['order']]):
+        return None
+    if np.abs(grid['xyz'] - fd_xyz[grid['order']]).max() > tolerance:
+        return None
+
+    return grid
+
+
+def get_fd_grid(fd_xyz, fd_atom_res, cutoff, fd_grid=None):
+    # Reuse a precomputed grid file when it matches these FD atoms, otherwise build one
+    if fd_grid is not None:
+        grid = load_fd_grid(fd_grid, fd_xyz, fd_atom_res, cutoff)
+        if grid is not None:
+            return grid
+        print(f'WARNING: {fd_grid} does not match the FD in this structure, rebuilding grid', file=sys.stderr)
+
+    return build_fd_grid(fd_xyz, fd_atom_res, cutoff)
+
+
+def query_fd_grid(grid, xyz):
+    '''
+    Find all (query atom, FD atom) pairs closer than the grid cutoff.
+
+    xyz is an (n, 3) array of query coordinates (Angstroms). Returns the query
+    indices and the indices into the grid-sorted FD atoms (use grid['atom_res']
+    to map these to FD residues).
+    '''
+    xyz = np.asarray(xyz, dtype=float)
+    cells = np.floor((xyz - grid['origin']) / grid['cutoff']).astype(int)
+
+    # Neighbouring cells for every query atom; drop those outside the grid
+    nbrs = cells[:, None, :] + CELL_OFFSETS[None, :, :]
+    in_grid = np.all((nbrs >= 0) & (nbrs < grid['shape']), axis=2)
+    q_idx, o_idx = np.nonzero(in_grid)
+    flat = np.ravel_multi_index(nbrs[q_idx, o_idx].T, grid['shape'])
+
+    # Expand each (query, cell) to one candidate per FD atom in that cell
+    n = grid['counts'][flat]
+    q_idx = np.repeat(q_idx, n)
+    offsets = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    fd_idx = np.repeat(grid['starts'][flat], n) + offsets
+
+    d2 = np.sum((xyz[q_idx] - grid['xyz'][fd_idx])**2, axis=1)
+    hits = d2 < grid['cutoff']**2
+
+    return q_idx[hits], fd_idx[hits]
+
+
+def moving_contact_pairs(fd_xyz, idr_xyz, cutoff):
+    '''
+    All (frame, idr atom, fd atom) pairs closer than cutoff when both sets of
+    atoms move, for fd_xyz (n_frames, n_fd, 3) and idr_xyz (n_frames, n_idr, 3).
+
+    The frames are laid side by side along x, more than a cutoff apart, so a
+    single grid over the whole block finds every pair. Only IDR atoms inside
+    the FD bounding box (plus cutoff) are queried, which also keeps them from
+    reaching into a neighbouring frame.
+    '''
+    n_frames, n_fd, _ = fd_xyz.shape
+    lo = fd_xyz.min(axis=(0, 1)) - cutoff
+    hi = fd_xyz.max(axis=(0, 1)) + cutoff
+    shift = np.zeros((n_frames, 1, 3))
+    shift[:, 0, 0] = np.arange(n_frames) * (hi[0] - lo[0] + cutoff)
+
+    grid = build_fd_grid((fd_xyz + shift).reshape(-1, 3), np.arange(n_frames * n_fd), cutoff)
+
+    frames, idr_idx = np.nonzero(np.all((idr_xyz >= lo) & (idr_xyz <= hi), axis=2))
+    q_idx, fd_idx = query_fd_grid(grid, idr_xyz[frames, idr_idx] + shift[frames, 0])
+
+    return frames[q_idx], idr_idx[q_idx], grid['atom_res'][fd_idx] % n_fd
+
+
+def frame_contact_pairs(grid, idr_xyz, idr_atom_res, n_idr_res, fd_side_xyz=None, fd_side_res=None):
+    '''
+    Residue level FD x IDR contacts for a block of frames.
+
+    idr_xyz is (n_frames, n_idr_atoms, 3) in Angstroms, matched against the
+    static grid. fd_side_xyz (n_frames, n_side_atoms, 3) optionally holds the
+    per-frame FD side-chain atoms, with their residues in fd_side_res. Returns
+    the unique (frame, idr_res, fd_res) contacts as three arrays.
+    '''
+    n_frames, n_atoms, _ = idr_xyz.shape
+    n_fd_res = grid['n_res']
+
+    q_idx, fd_idx = query_fd_grid(grid, idr_xyz.reshape(-1, 3))
+    frames = q_idx // n_atoms
+    idr_res = idr_atom_res[q_idx % n_atoms]
+    fd_res = grid['atom_res'][fd_idx]
+
+    if fd_side_xyz is not None and fd_side_xyz.shape[1] > 0:
+        side_frames, side_idr, side_fd = moving_contact_pairs(fd_side_xyz, idr_xyz, grid['cutoff'])
+        frames = np.concatenate([frames, side_frames])
+        idr_res = np.concatenate([idr_res, idr_atom_res[side_idr]])
+        fd_res = np.concatenate([fd_res, fd_side_res[side_fd]])
+
+    keys = np.unique((frames * n_idr_res + idr_res) * n_fd_res + fd_res)
+    fd_res = keys % n_fd_res
+    idr_res = (keys // n_fd_res) % n_idr_res
+    frames = keys // (n_fd_res * n_idr_res)
+
+    return frames, idr_res, fd_res
+
+
+def iter_trajectory(traj_file, start_pdb, chunk=500, stride=1, atom_indices=None):
+    '''
+    md.iterload, but compact archives (.h5) written by compact_trajectory.py are
+    streamed with iter_compact instead, so they can replace __traj.xtc.
+    '''
+    if os.path.splitext(traj_file)[1] == '.h5':
+        # Only needs h5py when an archive is actually read
+        from compact_trajectory import iter_compact
+        return iter_compact(traj_file, chunk=chunk, stride=stride, atom_indices=atom_indices)
+
+    return md.iterload(traj_file, top=start_pdb, chunk=chunk, stride=stride, atom_indices=atom_indices)
+
+
+def motif_contact_counts(frames, idr_res, motif, n_frames):
+    '''
+    Residue contacts per frame between a fixed (motif) IDR residue and the FD,
+    from the (frame, idr_res, fd_res) contacts of frame_contact_pairs. motif is
+    the boolean mask of fixed IDR residues.
+
+    This is the bound definition shared by the analysis scripts: a frame is
+    bound if it has at least one such contact.
+    '''
+    return np.bincount(frames[motif[idr_res]], minlength=n_frames)
+
+
+def iter_interface_blocks(start_pdb, traj_file, idr_fixed, cutoff=4.5, idr_first=False,
+                          chunk=500, stride=1, drift_tolerance=1.0, fd_grid=None, ca_only=False):
+    '''
+    Stream a trajectory in blocks of `chunk` frames against the FD backbone grid
+    and the per-frame FD side chains.
+
+    A frame is bound if any fixed (motif) IDR residue contacts the FD
+    (motif_contact_counts).
+
+    Yields (contact_counts [n_idr_res, n_fd_res], n_contacts [n_block],
+    bound [n_block]) for each block, where contact_counts is the number of
+    frames in the block with each residue pair in contact. fd_grid optionally
+    names a precomputed grid file (see setup_scripts/precompute_fd.py). With
+    ca_only, only CA atoms are used on both sides.
+    '''
+    start = md.load(start_pdb)
+    len_idr = len(idr_fixed)
+    fd_atoms, fd_atom_res, idr_atoms, idr_atom_res = get_fd_idr_atoms(start.top, len_idr, idr_first)
+    if ca_only:
+        fd_ca = np.array([start.top.atom(a).name == 'CA' for a in fd_atoms], dtype=bool)
+        idr_ca = np.array([start.top.atom(a).name == 'CA' for a in idr_atoms], dtype=bool)
+        fd_atoms, fd_atom_res = fd_atoms[fd_ca], fd_atom_res[fd_ca]
+        idr_atoms, idr_atom_res = idr_atoms[idr_ca], idr_atom_res[idr_ca]
+    fd_static, fd_static_res, fd_side, fd_side_res = split_fd_atoms(start.top, fd_atoms, fd_atom_res)
+    motif = np.array([s == '1' for s in idr_fixed])
+
+    grid = get_fd_grid(start.xyz[0, fd_static] * 10, fd_static_res, cutoff, fd_grid)
+    n_fd_res = grid['n_res']
+
+    # IDR and FD side-chain atoms are used every frame, the FD backbone only to check it stayed put
+    read_atoms = np.concatenate([idr_atoms, fd_side, fd_static])
+    # mdtraj reads atoms in index order; unsort them back into the layout above
+    read_order = np.argsort(read_atoms)
+    unsort = np.argsort(read_order)
+    fd_static_ref = start.xyz[0, fd_static] * 10
+    n_idr_atoms = len(idr_atoms)
+    n_moving = n_idr_atoms + len(fd_side)
+    max_drift = 0.0
+
+    for block in iter_trajectory(traj_file, start_pdb, chunk=chunk, stride=stride,
+                                 atom_indices=read_atoms[read_order]):
+        xyz = block.xyz[:, unsort] * 10
+        drift = np.sqrt(np.sum((xyz[:, n_moving:] - fd_static_ref)**2, axis=2))
+        max_drift = max(max_drift, float(drift.max()))
+
+        frames, idr_res, fd_res = frame_contact_pairs(grid, xyz[:, :n_idr_atoms], idr_atom_res, len_idr,
+                                                      xyz[:, n_idr_atoms:n_moving], fd_side_res)
+        n_block = len(xyz)
+
+        contact_counts = np.bincount(idr_res * n_fd_res + fd_res,
+                                     minlength=len_idr * n_fd_res).reshape(len_idr, n_fd_res)
+        n_contacts = np.bincount(frames, minlength=n_block)
+        bound = motif_contact_counts(frames, idr_res, motif, n_block) > 0
+
+        yield contact_counts, n_contacts, bound
+
+    if max_drift > drift_tolerance:
+        print(f'WARNING: FD backbone atoms moved up to {max_drift:.2f} A from __START.pdb; '
+              f'rigid FD grid assumption may not hold', file=sys.stderr)
+
+
+def interface_contacts(start_pdb, traj_file, idr_fixed, cutoff=4.5, idr_first=False,
+                       chunk=500, stride=1, drift_tolerance=1.0, fd_grid=None, ca_only=False):
+    '''
+    Stream a trajectory and accumulate FD x IDR contact counts and bound state.
+
+    Returns (contact_counts [n_idr_res, n_fd_res], n_contacts [n_frames],
+    bound [n_frames]).
+    '''
+    # Same shape as the grid's residue count, so an empty trajectory still gives a 2D array
+    _, fd_atom_res, _, _ = get_fd_idr_atoms(md.load_topology(start_pdb), len(idr_fixed), idr_first)
+    contact_counts = np.zeros((len(idr_fixed), int(np.max(fd_atom_res)) + 1), dtype=np.int64)
+    n_contacts = []
+    bound = []
+    for block_counts, block_n_contacts, block_bound in iter_interface_blocks(
+            start_pdb, traj_file, idr_fixed, cutoff=cutoff, idr_first=idr_first,
+            chunk=chunk, stride=stride, drift_tolerance=drift_tolerance, fd_grid=fd_grid, ca_only=ca_only):
+        contact_counts += block_counts
+        n_contacts.append(block_n_contacts)
+        bound.append(block_bound)
+
+    n_contacts = np.concatenate(n_contacts) if n_contacts else np.zeros(0, dtype=int)
+    bound = np.concatenate(bound) if bound else np.zeros(0, dtype=bool)
+
+    return contact_counts, n_contacts, bound
+
+
+## --------------------- MAIN --------------------- ##
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='FD x IDR interface contact analysis against a precomputed FD grid')
+    parser.add_argument('pdb', type=str, help='start PDB (__START.pdb) defining the fixed FD backbone coordinates')
+    parser.add_argument('traj', type=str, help='trajectory file (__traj.xtc) or compact archive (.h5)')
+    parser.add_argument('fixed_res_file', type=str, help='single line IDR fixed residues file')
+    parser.add_argument('--idr-first', action='store_true', help='flag if IDR is first chain in PDB')
+    parser.add_argument('--cutoff', type=float, default=None,
+                        help='contact distance in Angstroms (default=4.5 for heavy atoms, 8.0 with --ca-only)')
+    parser.add_argument('--ca-only', action='store_true',
+                        help='IDR CA to FD CA contacts, as in ev_reference_ensemble.py, instead of heavy atoms')
+    parser.add_argument('--chunk', type=int, default=500, help='frames read per block (default=500)')
+    parser.add_argument('--stride', type=int, default=1, help='only analyze every Nth frame (default=1)')
+    parser.add_argument('--fd-grid', type=str, default=None,
+                        help='precomputed FD grid (fd_grid.npz); rebuilt if it does not match __START.pdb '
+                             '(not used with --ca-only)')
+    parser.add_argument('--out-prefix', type=str, default='interface', help='prefix for output files')
+    args = parser.parse_args()
+
+    if args.cutoff is None:
+        args.cutoff = 8.0 if args.ca_only else 4.5
+    # The build-time grid holds FD backbone heavy atoms at 4.5 A, not FD CA atoms
+    fd_grid = None if args.ca_only else args.fd_grid
+    definition = f'IDR CA to FD CA within {args.cutoff} A' if args.ca_only else f'heavy atoms within {args.cutoff} A'
+
+    idr_fixed = read_fixed_residues(args.fixed_res_file)
+    contact_counts, n_contacts, bound = interface_contacts(args.pdb, args.traj, idr_fixed,
+                                                           cutoff=args.cutoff, idr_first=args.idr_first,
+                                                           chunk=args.chunk, stride=args.stride,
+                                                           fd_grid=fd_grid, ca_only=args.ca_only)
+    n_frames = len(bound)
+
+    # Rows are IDR residues, columns FD residues (both 1-indexed within chain)
+    np.savetxt(f'{args.out_prefix}_contact_frequencies.txt', contact_counts / max(n_frames, 1), fmt='%.4f',
+               header=f'FD x IDR contact frequencies ({definition}) over {n_frames} frames '
+                      f'(rows: IDR residues, columns: FD residues)')
+
+    # Frame numbers refer to __traj.xtc, so they account for --stride
+    with open(f'{args.out_prefix}_bound_state.txt', 'w') as out:
+        out.write('# frame n_contacts bound\n')
+        for i, (n, b) in enumerate(zip(n_contacts, bound)):
+            out.write(f'{i * args.stride} {n} {int(b)}\n')
+
+    print(f'Bound fraction: {bound.mean() if n_frames else 0.0:.4f} ({n_frames} frames)')
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+'''
+motif_bound_state.py
+
+Classify each frame of a FD+IDR trajectory by how the IDR motif is bound:
+
+    native     - motif CA RMSD to its __START.pdb (AF2) pose is below the cutoff
+    shifted    - motif sits in the native pose but shifted by +/- N residues (register shift)
+    nonnative  - motif contacts the FD, but not in the native pose or any register shift
+    unbound    - no motif residue contacts the FD
+
+Bound means at least --min-contacts residue contacts between a fixed (motif) IDR
+residue and the FD, the same definition (motif_contact_counts) as the bound
+state of fd_idr_interface_contacts.py. Flank-only contacts count as unbound.
+
+Frames are processed in blocks: every frame in a block is superposed onto the FD
+CA atoms of __START.pdb with one batched Kabsch fit, then the native and all
+register-shifted motif RMSDs are computed with array operations. Contacts use the
+static FD backbone grid plus the FD side chains of each (aligned) frame.
+
+Usage:
+
+> python motif_bound_state.py __START.pdb __traj.xtc fixed.txt --idr-first --out bound_state.txt
+
+'''
+
+import argparse
+import numpy as np
+import mdtraj as md
+from fd_idr_interface_contacts import (read_fixed_residues, get_fd_idr_atoms, split_fd_atoms, get_fd_grid,
+                                       frame_contact_pairs, motif_contact_counts, iter_trajectory)
+
+## --------------------- Functions --------------------- ##
+STATES = ['native', 'shifted', 'nonnative', 'unbound']
+
+
+def batched_superpose(mobile, ref):
+    '''
+    Least-squares (Kabsch) fit of every frame in mobile (n_frames, n_atoms, 3)
+    onto ref (n_atoms, 3).
+
+    Returns rotations (n_frames, 3, 3) and the mobile/reference centroids so that
+    any coordinates x from frame f are aligned by (x - mobile_com[f]) @ R[f] + ref_com.
+    '''
+    mobile_com = mobile.mean(axis=1, keepdims=True)
+    ref_com = ref.mean(axis=0)
+
+    H = np.einsum('fni,nj->fij', mobile - mobile_com, ref - ref_com)
+    U, S, Vt = np.linalg.svd(H)
+
+    # Correct for reflections
+    d = np.sign(np.linalg.det(U @ Vt))
+    U[:, :, 2] *= d[:, None]
+    R = U @ Vt
+
+    return R, mobile_com, ref_com
+
+
+def register_shift_indices(idr_fixed, max_shift):
+    '''
+    Indices of the motif residues for each register shift in [-max_shift, max_shift].
+
+    Returns (shifts, idxs, valid) where idxs is (n_shifts, n_motif); shifts that
+    would run off either end of the IDR are marked invalid.
+    '''
+    motif_start = idr_fixed.find('1')
+    motif_end = idr_fixed.rfind('1') + 1
+    if motif_start < 0:
+        raise Exception('No fixed (motif) residues in fixed residues string')
+
+    shifts = np.arange(-max_shift, max_shift + 1)
+    idxs = np.arange(motif_start, motif_end)[None, :] + shifts[:, None]
+    valid = (idxs.min(axis=1) >= 0) & (idxs.max(axis=1) < len(idr_fixed))
+
+    return shifts, np.clip(idxs, 0, len(idr_fixed) - 1), valid
+
+
+def motif_rmsds(idr_ca, ref_motif_ca, shift_idxs, shift_valid):
+    '''
+    RMSD of the motif at each register shift to the reference motif pose.
+
+    idr_ca is (n_frames, n_idr, 3), already in the reference (FD aligned) frame;
+    no further fitting is done since the pose relative to the FD is what matters.
+    Returns (n_frames, n_shifts) with np.inf for invalid shifts.
+    '''
+    diff = idr_ca[:, shift_idxs, :] - ref_motif_ca[None, None, :, :]
+    rmsd = np.sqrt(np.mean(np.sum(diff**2, axis=3), axis=2))
+    rmsd[:, ~shift_valid] = np.inf
+
+    return rmsd
+
+
+def classify_frames(native_rmsd, shift_rmsd, n_contacts, rmsd_cutoff=2.0, min_contacts=1):
+    '''
+    Label frames as native (0), shifted (1), nonnative (2) or unbound (3).
+
+    n_contacts is the number of motif residue x FD residue contacts per frame.
+    '''
+    states = np.full(len(native_rmsd), STATES.index('unbound'), dtype=int)
+    states[n_contacts >= min_contacts] = STATES.index('nonnative')
+    states[(shift_rmsd < rmsd_cutoff) & (n_contacts >= min_contacts)] = STATES.index('shifted')
+    states[(native_rmsd < rmsd_cutoff) & (n_contacts >= min_contacts)] = STATES.index('native')
+
+    return states
+
+
+def bound_states(start_pdb, traj_file, idr_fixed, idr_first=False, max_shift=4, rmsd_cutoff=2.0,
+                 contact_cutoff=4.5, min_contacts=1, chunk=500, stride=1, fd_grid=None):
+    '''
+    Stream a trajectory and classify every frame.
+
+    Returns a dict of per-frame arrays: native_rmsd, shift, shift_rmsd, n_contacts
+    (motif residue x FD residue contacts), state.
+    '''
+    start = md.load(start_pdb)
+    top = start.top
+    len_idr = len(idr_fixed)
+    fd_atoms, fd_atom_res, idr_atoms, idr_atom_res = get_fd_idr_atoms(top, len_idr, idr_first)
+    fd_static, fd_static_res, fd_side, fd_side_res = split_fd_atoms(top, fd_atoms, fd_atom_res)
+
+    fd_ca = np.array([a for a in fd_atoms if top.atom(a).name == 'CA'], dtype=int)
+    idr_ca = np.array([i for i, a in enumerate(idr_atoms) if top.atom(a).name == 'CA'], dtype=int)
+    if len(idr_ca) != len_idr:
+        raise Exception(f'Found {len(idr_ca)} IDR CA atoms, expected {len_idr}')
+
+    ref_xyz = start.xyz[0] * 10
+    grid = get_fd_grid(ref_xyz[fd_static], fd_static_res, contact_cutoff, fd_grid)
+    ref_fd_ca = ref_xyz[fd_ca]
+
+    motif = np.array([s == '1' for s in idr_fixed])
+    shifts, shift_idxs, shift_valid = register_shift_indices(idr_fixed, max_shift)
+    ref_motif_ca = ref_xyz[idr_atoms[idr_ca]][shift_idxs[shifts == 0][0]]
+    native_col = int(np.nonzero(shifts == 0)[0][0])
+    shift_cols = shifts != 0
+
+    read_atoms = np.concatenate([idr_atoms, fd_side, fd_ca])
+    # mdtraj reads atoms in index order; unsort them back into the layout above
+    read_order = np.argsort(read_atoms)
+    unsort = np.argsort(read_order)
+    n_idr_atoms = len(idr_atoms)
+    n_moving = n_idr_atoms + len(fd_side)
+
+    out = {'native_rmsd': [], 'shift': [], 'shift_rmsd': [], 'n_contacts': []}
+    for block in iter_trajectory(traj_file, start_pdb, chunk=chunk, stride=stride,
+                                 atom_indices=read_atoms[read_order]):
+        xyz = block.xyz[:, unsort] * 10
+        R, mobile_com, ref_com = batched_superpose(xyz[:, n_moving:], ref_fd_ca)
+        moving_xyz = np.einsum('fni,fij->fnj', xyz[:, :n_moving] - mobile_com, R) + ref_com
+        idr_xyz = moving_xyz[:, :n_idr_atoms]
+
+        rmsd = motif_rmsds(idr_xyz[:, idr_ca], ref_motif_ca, shift_idxs, shift_valid)
+        best = np.argmin(np.where(shift_cols[None, :], rmsd, np.inf), axis=1)
+
+        frames, idr_res, _ = frame_contact_pairs(grid, idr_xyz, idr_atom_res, len_idr,
+                                                 moving_xyz[:, n_idr_atoms:], fd_side_res)
+
+        out['native_rmsd'].append(rmsd[:, native_col])
+        out['shift'].append(shifts[best])
+        out['shift_rmsd'].append(rmsd[np.arange(len(rmsd)), best])
+        out['n_contacts'].append(motif_contact_counts(frames, idr_res, motif, len(xyz)))
+
+    for key in out:
+        out[key] = np.concatenate(out[key]) if out[key] else np.zeros(0)
+
+    out['state'] = classify_frames(out['native_rmsd'], out['shift_rmsd'], out['n_contacts'],
+                                   rmsd_cutoff=rmsd_cutoff, min_contacts=min_contacts)
+    return out
+
+
+## --------------------- MAIN --------------------- ##
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Classify frames as native, register-shifted, non-native bound or unbound')
+    parser.add_argument('pdb', type=str, help='start PDB (__START.pdb) with the AF2 motif pose')
+    parser.add_argument('traj', type=str, help='trajectory file (__traj.xtc) or compact archive (.h5)')
+    parser.add_argument('fixed_res_file', type=str, help='single line IDR fixed residues file')
+    parser.add_argument('--idr-first', action='store_true', help='flag if IDR is first chain in PDB')
+    parser.add_argument('--max-shift', type=int, default=4,
+                        help='largest register shift (in residues) to test in each direction (default=4)')
+    parser.add_argument('--rmsd-cutoff', type=float, default=2.0,
+                        help='motif CA RMSD in Angstroms below which a pose counts as bound (default=2.0)')
+    parser.add_argument('--contact-cutoff', type=float, default=4.5,
+                        help='heavy atom FD x IDR contact distance in Angstroms (default=4.5)')
+    parser.add_argument('--min-contacts', type=int, default=1,
+                        help='motif residue x FD residue contacts required to count as bound (default=1)')
+    parser.add_argument('--chunk', type=int, default=500, help='frames read per block (default=500)')
+    parser.add_argument('--stride', type=int, default=1, help='only analyze every Nth frame (default=1)')
+    parser.add_argument('--fd-grid', type=str, default=None,
+                        help='precomputed FD grid (fd_grid.npz); rebuilt if it does not match __START.pdb')
+    parser.add_argument('--out', type=str, default='bound_state.txt', help='output file')
+    args = parser.parse_args()
+
+    idr_fixed = read_fixed_residues(args.fixed_res_file)
+    res = bound_states(args.pdb, args.traj, idr_fixed, idr_first=args.idr_first, max_shift=args.max_shift,
+                       rmsd_cutoff=args.rmsd_cutoff, contact_cutoff=args.contact_cutoff,
+                       min_contacts=args.min_contacts, chunk=args.chunk, stride=args.stride,
+                       fd_grid=args.fd_grid)
+
+    # Frame numbers refer to __traj.xtc, so they account for --stride
+    with open(args.out, 'w') as out:
+        out.write('# frame native_rmsd best_shift shift_rmsd n_motif_contacts state\n')
+        for i in range(len(res['state'])):
+            out.write(f"{i * args.stride} {res['native_rmsd'][i]:.3f} {res['shift'][i]} {res['shift_rmsd'][i]:.3f} "
+                      f"{res['n_contacts'][i]} {STATES[res['state'][i]]}\n")
+
+    n_frames = max(len(res['state']), 1)
+    for i, state in enumerate(STATES):
+        print(f'{state:>10}: {np.sum(res["state"] == i) / n_frames:.4f}')
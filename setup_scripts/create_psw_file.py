@@ -13,6 +13,8 @@ parser.add_argument('fixed_res_file', type=str, help='single line IDR fixed resi
 parser.add_argument('outfile', type=str, help='output file')
 parser.add_argument('--idr-first', action='store_true', help='flag if IDR is first chain in PDB')
 parser.add_argument('--idr-caps', action='store_true', help='flag if IDR has ACE/NME caps')
+parser.add_argument('--fd-cache', type=str, default=None,
+                    help='FD directory from precompute_fd.py (reuses its PSW lines)')
 args = parser.parse_args()
 
 fd_seq = args.fd_seq
@@ -46,9 +48,22 @@ else:
 # Write file
 fixed_line =    '0.0 0.0 1.0 0.0 0.0 0.0 0.0 0.0 0.0 0.0 0.0'
 idr_line =      '1.0 1.0 1.0 0.0 1.0 0.0 1.0 1.0 0.0 0.0 0.0'
+
+# Precomputed FD lines, in place of the FD's '1's in full_fixed
+if args.fd_cache is not None:
+    with open(f'{args.fd_cache}/fd_psw.txt') as f:
+        fd_lines = [x.strip() for x in f if x.strip()]
+    if len(fd_lines) != len(fd_seq):
+        raise ValueError(f'ERROR: {args.fd_cache} has {len(fd_lines)} FD residues, expected {len(fd_seq)}')
+    fd_offset = len(full_fixed) - len(fd_fixed) if args.idr_first else 0
+else:
+    fd_lines = None
+
 s = 'R\n'
 for i, state in enumerate(list(full_fixed)):
-    if state == '1':
+    if fd_lines is not None and fd_offset <= i < fd_offset + len(fd_lines):
+        s += f'{i+1}\t{fd_lines[i-fd_offset]}\n'
+    elif state == '1':
         s += f'{i+1}\t{fixed_line}\n'
     elif state == '0':
         s += f'{i+1}\t{idr_line}\n'
@@ -14,6 +14,8 @@ parser.add_argument('outfile', type=str, help='output file')
 parser.add_argument('--idr-first', action='store_true', help='flag if IDR is first chain in PDB')
 parser.add_argument('--idr-caps', action='store_true', help='cap IDR with ACE and NME')
 parser.add_argument('--fd-caps', action='store_true', help='cap FD with ACE and NME')
+parser.add_argument('--fd-cache', type=str, default=None,
+                    help='FD directory from precompute_fd.py (reuses its seq.in block and net charge)')
 args = parser.parse_args()
 
 fd_seq = args.fd_seq
@@ -55,7 +57,11 @@ else:
 
 
 # Iterate through FD, adding residues to string
-if args.fd_caps: # Add ACE and NME caps to FD
+if args.fd_cache is not None: # Precomputed FD block
+    with open(f'{args.fd_cache}/fd_seq.in') as f:
+        s += f.read()
+
+elif args.fd_caps: # Add ACE and NME caps to FD
     s += 'ACE\n'
     s += f'{aa_code[fd_seq[0]]}\n'
     for fd_aa in list(fd_seq)[1:-1]:
@@ -89,11 +95,15 @@ if not args.idr_first:
 
 # Get net charge
 net_charge = 0
-for i, fd_aa in enumerate(list(fd_seq)):
-    if fd_aa in ['D', 'E']:
-        net_charge -= 1
-    elif fd_aa in ['R', 'K']:
-        net_charge += 1
+if args.fd_cache is not None:
+    with open(f'{args.fd_cache}/fd_charge.txt') as f:
+        net_charge += int(f.read().strip())
+else:
+    for i, fd_aa in enumerate(list(fd_seq)):
+        if fd_aa in ['D', 'E']:
+            net_charge -= 1
+        elif fd_aa in ['R', 'K']:
+            net_charge += 1
 for idr_aa in list(idr_seq):
     if idr_aa in ['D', 'E']:
         net_charge -= 1
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+'''
+generate_variant_library.py
+
+Generate motif-preserving IDR variant libraries from a parent IDR and write the
+build inputs (IDR_variants.isf, fixed_residues.txt, pdb_structures.txt) for
+build_FD_IDR_sim_infrastructure_v1.sh. Only flexible residues ('0' in the
+fixed residues mask) are changed, so the parent PDB remains valid for every
+variant.
+
+Designs:
+    saturation - every single substitution at every flexible position
+    scramble   - composition-preserving shuffles of the flexible residues
+    charge     - flank permutations spanning the range of charge patterning (SCD)
+
+Every variant is built against every FD in the campaign's FD.isf, so each
+(sequence, fixed residues, FD sequence) pairing is hashed. A variant is dropped
+when all of its pairings are already known: repeated within the library, in
+--previous campaign input files, or in a persistent --registry shared across
+campaigns. Scramble and charge variants are numbered past the highest scr/scd
+number already known for the parent, so a new variant never reuses the name
+(and ${idr_name}_${fd_name} build directory) of an earlier one.
+
+Usage:
+
+> python generate_variant_library.py idr.isf fixed.txt FD.isf --designs saturation scramble charge --pdb ATF4_TAZ2.pdb --registry ~/variant_registry.txt --out-prefix ATF4
+
+'''
+
+import os
+import hashlib
+import argparse
+import numpy as np
+from validate_campaign import read_isf
+
+## --------------------- Functions --------------------- ##
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+CHARGE = {'D': -1, 'E': -1, 'K': 1, 'R': 1}
+
+
+def read_single_line(fname):
+    with open(fname) as f:
+        lines = [x.strip().split() for x in f if x.strip()]
+    return lines[0][0], lines[0][1]
+
+
+def has_flexible_proline(seq, fixed):
+    # Same check as check_prolines.py (decides FMCSC_PKRFREQ in the key files)
+    return any(state == '0' and res == 'P' for state, res in zip(fixed, seq))
+
+
+def variant_hash(seq, fixed, fd_seq):
+    return hashlib.sha1(f'{seq}:{fixed}:{fd_seq}'.encode()).hexdigest()[:16]
+
+
+def next_index(names, prefix):
+    # First number not yet used by any known name of the form {prefix}{i}
+    used = [int(n[len(prefix):]) for n in names if n.startswith(prefix) and n[len(prefix):].isdigit()]
+    return max(used, default=0) + 1
+
+
+def saturation_variants(name, seq, fixed, alphabet=AMINO_ACIDS):
+    flexible = [i for i, state in enumerate(fixed) if state == '0']
+    variants = []
+    for i in flexible:
+        for aa in alphabet:
+            if aa != seq[i]:
+                variants.append((f'{name}_{seq[i]}{i+1}{aa}', seq[:i] + aa + seq[i+1:]))
+    return variants
+
+
+def flank_permutations(seq, fixed, n, rng):
+    '''
+    n random permutations of the flexible residues, with the fixed residues left
+    in place. Returns an (n, len(seq)) array of single characters.
+    '''
+    seq_arr = np.array(list(seq))
+    flexible = np.array([i for i, state in enumerate(fixed) if state == '0'], dtype=int)
+    perms = np.argsort(rng.random((n, len(flexible))), axis=1)
+
+    out = np.repeat(seq_arr[None, :], n, axis=0)
+    out[:, flexible] = seq_arr[flexible][perms]
+    return out
+
+
+def scramble_variants(name, seq, fixed, n, rng, first=1):
+    perms = flank_permutations(seq, fixed, n, rng)
+    return [(f'{name}_scr{first+i}', ''.join(p)) for i, p in enumerate(perms)]
+
+
+def sequence_charge_decoration(seqs):
+    '''
+    SCD (Sawle & Ghosh) for an (n, N) array of sequences:
+    SCD = 1/N sum_{i<j} q_i q_j |i-j|^0.5. More negative is more segregated.
+    '''
+    q = np.vectorize(lambda aa: CHARGE.get(aa, 0))(seqs).astype(float)
+    N = q.shape[1]
+    idx = np.arange(N)
+    sep = np.sqrt(np.abs(idx[:, None] - idx[None, :]))
+    return np.einsum('ni,ij,nj->n', q, sep, q) / (2 * N)
+
+
+def charge_pattern_variants(name, seq, fixed, n, rng, n_candidates=20000, first=1):
+    '''
+    Sample many flank permutations and keep n spanning the SCD range evenly
+    (from most segregated to most mixed).
+    '''
+    flexible_charges = [seq[i] for i, state in enumerate(fixed) if state == '0' and seq[i] in CHARGE]
+    if len(flexible_charges) < 2:
+        return []
+
+    perms = flank_permutations(seq, fixed, n_candidates, rng)
+    scd = sequence_charge_decoration(perms)
+    order = np.argsort(scd)
+    picks = order[np.unique(np.linspace(0, len(order) - 1, n).round().astype(int))]
+
+    return [(f'{name}_scd{first+i}', ''.join(perms[p])) for i, p in enumerate(picks)]
+
+
+def read_registry(fname):
+    registry = {}
+    if fname is not None and os.path.exists(fname):
+        with open(fname) as f:
+            for line in f:
+                line = line.strip().split()
+                if line and not line[0].startswith('#'):
+                    registry[line[0]] = line[1]
+    return registry
+
+
+def read_previous(seqfile, fixed_res_file, fd_seqfile):
+    # {hash: name} for every IDR x FD pairing of a previous campaign's input files
+    seqs = read_isf(seqfile)
+    masks = dict(read_isf(fixed_res_file))
+    fds = read_isf(fd_seqfile)
+
+    previous = {}
+    for idr_name, idr_seq in seqs:
+        if idr_name not in masks:
+            raise Exception(f'{idr_name} from {seqfile} has no entry in {fixed_res_file}')
+        for _, fd_seq in fds:
+            previous.setdefault(variant_hash(idr_seq, masks[idr_name], fd_seq), idr_name)
+    return previous
+
+
+def deduplicate(variants, fixed, fd_seqs, known):
+    '''
+    Drop variants whose pairings with every FD in fd_seqs are already known
+    (registry or previous campaigns, as {hash: name}) or repeated within this
+    library.
+
+    Returns (kept, dropped) where kept entries carry the hash of each FD pairing
+    and dropped entries the name they duplicate.
+    '''
+    seen = dict(known)
+    kept, dropped = [], []
+    for name, seq in variants:
+        hashes = [variant_hash(seq, fixed, fd_seq) for fd_seq in fd_seqs]
+        if all(h in seen for h in hashes):
+            dropped.append((name, seen[hashes[0]]))
+        else:
+            for h in hashes:
+                seen.setdefault(h, name)
+            kept.append((name, seq, hashes))
+    return kept, dropped
+
+
+## --------------------- MAIN --------------------- ##
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='generate a deduplicated motif-preserving IDR variant library')
+    parser.add_argument('idr_seqfile', type=str, help='single line parent IDR amino acid sequence file')
+    parser.add_argument('fixed_res_file', type=str, help='single line IDR fixed residues file')
+    parser.add_argument('fd_seqfile', type=str, help='FD sequence file of the campaign (FD.isf, one FD per line)')
+    parser.add_argument('--designs', nargs='+', choices=['saturation', 'scramble', 'charge'],
+                        default=['saturation'], help='designs to generate (default=saturation)')
+    parser.add_argument('--alphabet', type=str, default=AMINO_ACIDS,
+                        help='amino acids used for saturation mutagenesis (default=all 20)')
+    parser.add_argument('--n-scrambles', type=int, default=10, help='number of flank scrambles (default=10)')
+    parser.add_argument('--n-charge', type=int, default=10, help='number of charge patterning variants (default=10)')
+    parser.add_argument('--no-new-prolines', action='store_true',
+                        help='drop variants with flexible prolines if the parent has none (keeps FMCSC_PKRFREQ 0)')
+    parser.add_argument('--include-parent', action='store_true', help='include the parent sequence in the library')
+    parser.add_argument('--pdb', type=str, default=None,
+                        help='parent complex PDB; written to pdb_structures.txt for every variant')
+    parser.add_argument('--previous', nargs=3, action='append', default=[],
+                        metavar=('IDR_SEQFILE', 'FIXED_RES_FILE', 'FD_SEQFILE'),
+                        help='IDR sequence, fixed residues and FD sequence files of a previous campaign to '
+                             'deduplicate against (repeat for several campaigns)')
+    parser.add_argument('--registry', type=str, default=None,
+                        help='persistent hash registry shared across campaigns (read, then appended to)')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for scrambles')
+    parser.add_argument('--out-prefix', type=str, default='library', help='prefix for output files')
+    args = parser.parse_args()
+
+    name, seq = read_single_line(args.idr_seqfile)
+    _, fixed = read_single_line(args.fixed_res_file)
+    if len(seq) != len(fixed):
+        raise Exception(f'Sequence ({len(seq)}) and fixed residues ({len(fixed)}) lengths differ')
+
+    fds = read_isf(args.fd_seqfile)
+    fd_seqs = [fd_seq for _, fd_seq in fds]
+    rng = np.random.default_rng(args.seed)
+
+    known = read_registry(args.registry)
+    for seqfile, fixed_res_file, fd_seqfile in args.previous:
+        for h, n in read_previous(seqfile, fixed_res_file, fd_seqfile).items():
+            known.setdefault(h, n)
+
+    variants = [(name, seq)] if args.include_parent else []
+    if 'saturation' in args.designs:
+        variants += saturation_variants(name, seq, fixed, args.alphabet)
+    if 'scramble' in args.designs:
+        variants += scramble_variants(name, seq, fixed, args.n_scrambles, rng,
+                                      first=next_index(known.values(), f'{name}_scr'))
+    if 'charge' in args.designs:
+        variants += charge_pattern_variants(name, seq, fixed, args.n_charge, rng,
+                                            first=next_index(known.values(), f'{name}_scd'))
+
+    if args.no_new_prolines and not has_flexible_proline(seq, fixed):
+        variants = [(n, s) for n, s in variants if not has_flexible_proline(s, fixed)]
+
+    # The parent is always known, so variants identical to it are dropped unless requested
+    if not args.include_parent:
+        for fd_seq in fd_seqs:
+            known.setdefault(variant_hash(seq, fixed, fd_seq), name)
+
+    kept, dropped = deduplicate(variants, fixed, fd_seqs, known)
+
+    with open(f'{args.out_prefix}_IDR_variants.isf', 'w') as out:
+        for n, s, _ in kept:
+            out.write(f'{n} {s}\n')
+
+    with open(f'{args.out_prefix}_fixed_residues.txt', 'w') as out:
+        for n, _, _ in kept:
+            out.write(f'{n} {fixed}\n')
+
+    if args.pdb is not None:
+        with open(f'{args.out_prefix}_pdb_structures.txt', 'w') as out:
+            for n, _, _ in kept:
+                out.write(f'{n} {args.pdb}\n')
+
+    # One registry line per new IDR x FD pairing
+    if args.registry is not None:
+        with open(args.registry, 'a') as out:
+            for n, s, hashes in kept:
+                for (fd_name, _), h in zip(fds, hashes):
+                    if h not in known:
+                        out.write(f'{h} {n} {s} {fixed} {fd_name}\n')
+
+    print(f'{len(kept)} variants written, {len(dropped)} duplicates removed')
+    for n, original in dropped:
+        print(f'  {n} duplicates {original}')
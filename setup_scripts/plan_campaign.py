@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+'''
+plan_campaign.py
+
+Predict wall time and core-hours for every variant of a campaign before
+submission, and suggest how to bundle replicas into jobs under a wall-clock limit.
+
+Cost model: the wall time of one replica is (effective MC steps) x (seconds per
+step), where the effective steps include TSMC/HSMC auxiliary chains
+(attempts x enter probability x aux steps x number of temperatures) and the
+seconds per step are a linear fit
+
+    seconds/step = c0 + c1 * n_atoms + c2 * n_idr + c3 * (droplet radius / 100 A)^3
+
+to a calibration table of finished (short local or previous production) runs.
+Terms that are constant or collinear in the calibration (e.g. every run at the
+same droplet radius) are dropped before the fit. With no more calibration runs
+than remaining terms, seconds/step is taken as proportional to n_atoms. The
+model used is printed with the plan.
+
+The droplet radius is the FMCSC_SIZE of run.key, the keyfile the replicas
+actually run (the build script deletes the production.key written by autoSim).
+run.key is copied from keyfiles/, so the radius only varies between calibration
+runs whose template was edited; otherwise the radius term is dropped from the fit.
+
+Calibration file (one run per line, whitespace separated, '#' comments):
+
+    name n_atoms n_idr radius mode pre_eq eq prod aux_prob aux_freq aux_nsteps seconds
+
+> plan_campaign.py record coil_start/1 --seconds 5400 --n-idr 60 >> calibration.txt
+> plan_campaign.py plan IDR_variants.isf FD.isf calibration.txt --mode ts --prod 60000000 --reps 4 --walltime-hours 168
+
+For 'plan', variants that are already built (<IDR>_<FD>/__START.pdb exists in
+the current directory) use their exact atom count and the radius of their
+run.key; otherwise the atom count is estimated from the sequences and the radius
+taken from the template keyfile for --mode. run_sims.py has
+no restart path, so replicas longer than --walltime-hours are reported with the
+largest PROD that fits and the number of replicas giving the same sampling.
+
+'''
+
+import os
+import re
+import argparse
+import numpy as np
+
+## --------------------- Functions --------------------- ##
+# All-atom (incl. hydrogen) counts per residue as built by CAMPARI (HIS as HIE, D/E/K/R charged)
+RESIDUE_ATOMS = {'A': 10, 'R': 24, 'N': 14, 'D': 12, 'C': 11, 'Q': 17, 'E': 15, 'G': 7, 'H': 17, 'I': 19,
+                 'L': 19, 'K': 22, 'M': 17, 'F': 20, 'P': 14, 'S': 11, 'T': 14, 'W': 24, 'Y': 21, 'V': 16}
+CAP_ATOMS = 12       # ACE + NME
+TERMINI_ATOMS = 3    # extra atoms of charged N- and C-termini of an uncapped chain
+N_AUX_TEMPS = 10     # number of auxiliary temperatures written by create_tsmc_run_script.py
+KEYFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'keyfiles')
+
+CALIBRATION_FIELDS = ['name', 'n_atoms', 'n_idr', 'radius', 'mode', 'pre_eq', 'eq', 'prod',
+                      'aux_prob', 'aux_freq', 'aux_nsteps', 'seconds']
+FEATURE_NAMES = ['1', 'n_atoms', 'n_idr', '(radius/100)^3']
+
+
+def effective_steps(mode, pre_eq, eq, prod, aux_prob=0.8, aux_freq=25000, aux_nsteps=500):
+    # Mirrors the loop written by create_tsmc_run_script.py
+    if mode in ['standard', 'ev']:
+        return pre_eq + eq + prod
+
+    n_attempts = int(np.ceil(prod / aux_freq))
+    n_sub = N_AUX_TEMPS if mode == 'ts' else 1
+    return pre_eq + eq + n_attempts * aux_freq + n_attempts * aux_prob * aux_nsteps * n_sub
+
+
+def estimate_atoms(idr_seq, fd_seq, idr_caps=True):
+    n = sum(RESIDUE_ATOMS[aa] for aa in idr_seq + fd_seq)
+    n += CAP_ATOMS if idr_caps else TERMINI_ATOMS
+    n += TERMINI_ATOMS
+
+    # Counter ions added by create_sequence_file.py
+    charge = sum(1 for aa in idr_seq + fd_seq if aa in 'KR') - sum(1 for aa in idr_seq + fd_seq if aa in 'DE')
+    return n + abs(charge)
+
+
+def count_pdb_atoms(pdbfile):
+    with open(pdbfile) as f:
+        return sum(1 for line in f if line.startswith('ATOM') or line.startswith('HETATM'))
+
+
+def read_keyfile_size(keyfile):
+    with open(keyfile) as f:
+        for line in f:
+            line = line.split()
+            if len(line) >= 2 and line[0] == 'FMCSC_SIZE':
+                return float(line[1])
+    raise Exception(f'No FMCSC_SIZE in {keyfile}')
+
+
+def template_keyfile(mode):
+    # The keyfile the build script copies to run.key for this MC_MODE
+    return os.path.join(KEYFILE_DIR, 'run_EV_FD_IDR.key' if mode == 'ev' else 'run_FD_IDR.key')
+
+
+def read_calibration(fname):
+    records = []
+    with open(fname) as f:
+        for line in f:
+            line = line.split('#')[0].split()
+            if not line:
+                continue
+            if len(line) != len(CALIBRATION_FIELDS):
+                raise Exception(f'Calibration line has {len(line)} fields, expected {len(CALIBRATION_FIELDS)}: {line}')
+            rec = dict(zip(CALIBRATION_FIELDS, line))
+            for key in CALIBRATION_FIELDS[1:]:
+                if key != 'mode':
+                    rec[key] = float(rec[key])
+            records.append(rec)
+    return records
+
+
+def _features(n_atoms, n_idr, radius):
+    n_atoms, n_idr, radius = np.atleast_1d(n_atoms, n_idr, radius)
+    return np.stack([np.ones_like(n_atoms, dtype=float), n_atoms, n_idr, (radius / 100.0)**3], axis=1)
+
+
+def independent_columns(X, rtol=1e-8):
+    '''
+    Indices of the columns of X kept in order (intercept first) while each one
+    still adds to the rank, so constant or collinear terms are dropped.
+    '''
+    scaled = X / np.maximum(np.abs(X).max(axis=0), 1e-300)
+    keep = []
+    for j in range(X.shape[1]):
+        if np.linalg.matrix_rank(scaled[:, keep + [j]], tol=rtol * len(X)) == len(keep) + 1:
+            keep.append(j)
+    return keep
+
+
+def fit_cost_model(records):
+    '''
+    Fit seconds per effective step. Returns (cost, description) where cost is a
+    function (n_atoms, n_idr, radius) -> seconds/step.
+    '''
+    if len(records) == 0:
+        raise Exception('No calibration records')
+
+    steps = np.array([effective_steps(r['mode'], r['pre_eq'], r['eq'], r['prod'], r['aux_prob'],
+                                      r['aux_freq'], r['aux_nsteps']) for r in records])
+    sec_per_step = np.array([r['seconds'] for r in records]) / steps
+    n_atoms = np.array([r['n_atoms'] for r in records])
+    X = _features(n_atoms, np.array([r['n_idr'] for r in records]), np.array([r['radius'] for r in records]))
+
+    keep = independent_columns(X)
+    if len(records) > len(keep) and len(keep) > 1:
+        coef, _, _, _ = np.linalg.lstsq(X[:, keep], sec_per_step, rcond=None)
+        floor = sec_per_step.min() * 0.1
+        dropped = [FEATURE_NAMES[j] for j in range(X.shape[1]) if j not in keep]
+        description = 'seconds/step = ' + ' + '.join(f'{c:.3e}*{FEATURE_NAMES[j]}' for c, j in zip(coef, keep))
+        if dropped:
+            description += f" (dropped constant/collinear: {', '.join(dropped)})"
+        return lambda a, i, r: np.maximum(_features(a, i, r)[:, keep] @ coef, floor), description
+
+    # Too few calibration runs (or nothing varies) for a fit
+    per_atom = np.mean(sec_per_step / n_atoms)
+    description = f'seconds/step = {per_atom:.3e}*n_atoms (too few distinct calibration runs for a fit)'
+    return lambda a, i, r: per_atom * np.atleast_1d(a).astype(float), description
+
+
+def bundle_replicas(jobs, limit_seconds):
+    '''
+    First-fit decreasing packing of (name, seconds) replicas into serial jobs
+    no longer than limit_seconds. Replicas longer than the limit get their own job.
+    '''
+    bins = []
+    for name, seconds in sorted(jobs, key=lambda x: -x[1]):
+        for b in bins:
+            if b['seconds'] + seconds <= limit_seconds:
+                b['replicas'].append(name)
+                b['seconds'] += seconds
+                break
+        else:
+            bins.append({'replicas': [name], 'seconds': seconds})
+    return bins
+
+
+def parse_run_script(fname):
+    # Recover the simulation parameters from a run_sims.py written by create_tsmc_run_script.py
+    with open(fname) as f:
+        s = f.read()
+
+    pre_eq = int(re.search(r'preEquilMC\(steps=(\d+)', s).group(1))
+    eq = int(re.search(r'EquilMC\(steps=(\d+)', s.split('preEquilMC')[-1]).group(1))
+    loop = re.search(r'for i in range\((\d+)\)', s)
+
+    if loop is None:
+        prod = int(re.search(r'StandardMC\(steps=(\d+)', s).group(1))
+        return {'mode': 'standard', 'pre_eq': pre_eq, 'eq': eq, 'prod': prod,
+                'aux_prob': 0, 'aux_freq': 1, 'aux_nsteps': 0}
+
+    aux_freq = int(re.search(r'StandardMC\(steps=(\d+)', s).group(1))
+    aux_prob = float(re.search(r'if ([\d.]+) > random', s).group(1))
+    ts = re.search(r'TempSweepMC\(steps=(\d+)', s)
+    hs = re.search(r'HamiltonianSwitchMC\(steps=(\d+)', s)
+    aux_nsteps = int((ts or hs).group(1))
+
+    return {'mode': 'ts' if ts else 'hs', 'pre_eq': pre_eq, 'eq': eq, 'prod': int(loop.group(1)) * aux_freq,
+            'aux_prob': aux_prob, 'aux_freq': aux_freq, 'aux_nsteps': aux_nsteps}
+
+
+## --------------------- MAIN --------------------- ##
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='predict campaign cost and bundle replicas into jobs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record = subparsers.add_parser('record', help='print a calibration line for a finished replica directory')
+    record.add_argument('rep_dir', type=str,
+                        help='replica directory (with run_sims.py, run.key, __START.pdb)')
+    record.add_argument('--seconds', type=float, required=True, help='measured wall time of the run')
+    record.add_argument('--n-idr', type=int, required=True, help='IDR length in residues')
+    record.add_argument('--name', type=str, default=None, help='name for this record (default=rep_dir)')
+
+    plan = subparsers.add_parser('plan', help='predict wall time / core-hours and bundle replicas')
+    plan.add_argument('idr_seqfile', type=str, help='IDR sequence file (one IDR per line)')
+    plan.add_argument('fd_seqfile', type=str, help='FD sequence file (one FD per line)')
+    plan.add_argument('calibration', type=str, help='calibration file')
+    plan.add_argument('--mode', choices=['standard', 'ev', 'ts', 'hs'], default='ts', help='MC_MODE (default=ts)')
+    plan.add_argument('--pre-eq', type=int, default=2000000, help='PRE_EQ (default=2000000)')
+    plan.add_argument('--eq', type=int, default=4000000, help='EQ (default=4000000)')
+    plan.add_argument('--prod', type=int, default=60000000, help='PROD (default=60000000)')
+    plan.add_argument('--reps', type=int, default=4, help='REPS (default=4)')
+    plan.add_argument('--sim-mode', choices=['coil', 'helical', 'combined'], default='coil',
+                      help='SIM_MODE (default=coil)')
+    plan.add_argument('--aux-enter-prob', type=float, default=0.8, help='AUXCHAIN_ENTERPROB (default=0.8)')
+    plan.add_argument('--aux-chain-freq', type=int, default=25000, help='AUXCHAIN_ENTERFREQ (default=25000)')
+    plan.add_argument('--aux-chain-steps', type=int, default=500, help='AUXCHAIN_NSTEPS (default=500)')
+    plan.add_argument('--droplet-radius', type=float, default=None,
+                      help='droplet radius (A) for variants that are not built yet '
+                           '(default=FMCSC_SIZE of the template keyfile for --mode)')
+    plan.add_argument('--cores-per-replica', type=int, default=1, help='cores used by one replica (default=1)')
+    plan.add_argument('--walltime-hours', type=float, default=None, help='wall-clock limit per job')
+    plan.add_argument('--safety', type=float, default=0.9,
+                      help='fraction of the wall-clock limit to fill when bundling (default=0.9)')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        params = parse_run_script(os.path.join(args.rep_dir, 'run_sims.py'))
+        n_atoms = count_pdb_atoms(os.path.join(args.rep_dir, '__START.pdb'))
+        radius = read_keyfile_size(os.path.join(args.rep_dir, 'run.key'))
+        name = args.name if args.name is not None else args.rep_dir.replace(' ', '_')
+        print(f"{name} {n_atoms} {args.n_idr} {radius} {params['mode']} {params['pre_eq']} {params['eq']} "
+              f"{params['prod']} {params['aux_prob']} {params['aux_freq']} {params['aux_nsteps']} {args.seconds}")
+
+    else:
+        with open(args.idr_seqfile) as f:
+            idrs = [x.split()[:2] for x in f if x.strip()]
+        with open(args.fd_seqfile) as f:
+            fds = [x.split()[:2] for x in f if x.strip()]
+
+        cost, description = fit_cost_model(read_calibration(args.calibration))
+        print(f'# cost model: {description}')
+        steps = effective_steps(args.mode, args.pre_eq, args.eq, args.prod, args.aux_enter_prob,
+                                args.aux_chain_freq, args.aux_chain_steps)
+        start_modes = {'coil': ['coil_start'], 'helical': ['helical_start'],
+                       'combined': ['coil_start', 'helical_start']}[args.sim_mode]
+        n_reps = args.reps * len(start_modes)
+
+        default_radius = args.droplet_radius
+        if default_radius is None:
+            default_radius = read_keyfile_size(template_keyfile(args.mode))
+
+        print('# variant n_atoms n_idr radius hours_per_replica core_hours')
+        replicas = []
+        total_core_hours = 0.0
+        for fd_name, fd_seq in fds:
+            for idr_name, idr_seq in idrs:
+                name = f'{idr_name}_{fd_name}'
+                if os.path.exists(f'{name}/__START.pdb'):
+                    n_atoms = count_pdb_atoms(f'{name}/__START.pdb')
+                    radius = default_radius
+                    if os.path.exists(f'{name}/run.key'):
+                        radius = read_keyfile_size(f'{name}/run.key')
+                else:
+                    n_atoms = estimate_atoms(idr_seq, fd_seq)
+                    radius = default_radius
+
+                seconds = float(cost(n_atoms, len(idr_seq), radius)[0] * steps)
+                core_hours = seconds / 3600 * n_reps * args.cores_per_replica
+                total_core_hours += core_hours
+                replicas.extend((f'{name}/{m}/{i+1}', seconds) for m in start_modes for i in range(args.reps))
+                print(f'{name} {n_atoms} {len(idr_seq)} {radius:.1f} {seconds/3600:.2f} {core_hours:.1f}')
+
+        print(f'# campaign: {len(replicas)} replicas, {total_core_hours:.1f} core-hours, '
+              f'longest replica {max(s for _, s in replicas)/3600:.2f} h')
+
+        if args.walltime_hours is not None:
+            limit = args.walltime_hours * 3600 * args.safety
+            bins = bundle_replicas(replicas, limit)
+            print(f'# {len(bins)} jobs under {args.walltime_hours} h (filled to {args.safety:.0%})')
+            for i, b in enumerate(bins):
+                flag = ''
+                if b['seconds'] > limit:
+                    # run_sims.py always reruns preEquil and Equil, so shorten PROD instead of restarting
+                    eq_seconds = b['seconds'] * (args.pre_eq + args.eq) / steps
+                    fit = (limit - eq_seconds) / (b['seconds'] - eq_seconds)
+                    prod_fit = int(fit * args.prod // args.aux_chain_freq * args.aux_chain_freq) if fit > 0 else 0
+                    if prod_fit > 0:
+                        flag = (f' EXCEEDS LIMIT - use --prod {prod_fit} with '
+                                f'{int(np.ceil(args.prod / prod_fit))}x the replicas for the same sampling')
+                    else:
+                        flag = ' EXCEEDS LIMIT - equilibration alone does not fit; raise --walltime-hours'
+                print(f"job{i+1} {b['seconds']/3600:.2f}h {','.join(b['replicas'])}{flag}")
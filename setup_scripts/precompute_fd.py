@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+'''
+precompute_fd.py
+
+Compute the folded domain (FD) side of the build once per FD so it can be reused
+for every IDR paired with it in a FD x IDR matrix campaign.
+
+> precompute_fd.py sequence FD.isf fd_cache
+
+    For each line (<FD_name> <FD_seq>) of FD.isf, writes fd_cache/<FD_name>/ with
+        fd_seq.in     - FD residue block of seq.in (used by create_sequence_file.py --fd-cache)
+        fd_psw.txt    - FD residue lines of PSWFILE.psw (used by create_psw_file.py --fd-cache)
+        fd_charge.txt - FD net charge (used by create_sequence_file.py --fd-cache)
+
+> precompute_fd.py grid __START.pdb fixed.tmp fd_cache/<FD_name>/fd_grid.npz --idr-first
+
+    Builds the FD backbone contact grid used by the analysis scripts from the CAMPARI
+    __START.pdb the first time an FD is built, and links it as fd_grid.npz in the
+    current directory. Later pairings reuse the cached grid if their FD
+    coordinates match, otherwise a local fd_grid.npz is written instead.
+
+'''
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis_scripts'))
+
+## --------------------- Functions --------------------- ##
+# AA code conversion table (as in create_sequence_file.py)
+aa_code = {}
+code1let = 'ACDEFGHIKLMNPQRSTVWY'
+code3let = ['Ala','Cys','Asp','Glu','Phe','Gly','Hie','Ile','Lys','Leu',
+            'Met','Asn','Pro','Gln','Arg','Ser','Thr','Val','Trp','Tyr']
+for i, aa in enumerate(list(code1let)):
+    aa_code[aa] = code3let[i].upper()
+
+# PSW line for fixed residues (as in create_psw_file.py)
+fixed_line = '0.0 0.0 1.0 0.0 0.0 0.0 0.0 0.0 0.0 0.0 0.0'
+
+
+def fd_sequence_block(fd_seq, fd_caps=False):
+    if fd_caps:
+        s = 'ACE\n'
+        s += f'{aa_code[fd_seq[0]]}\n'
+        for fd_aa in list(fd_seq)[1:-1]:
+            s += f'{aa_code[fd_aa]}\n'
+        s += f'{aa_code[fd_seq[-1]]}\n'
+        s += 'NME\n'
+    else:
+        s = f'{aa_code[fd_seq[0]]}_N\n'
+        for fd_aa in list(fd_seq)[1:-1]:
+            s += f'{aa_code[fd_aa]}\n'
+        s += f'{aa_code[fd_seq[-1]]}_C\n'
+
+    return s
+
+
+def fd_net_charge(fd_seq):
+    return sum(1 for aa in fd_seq if aa in ['R', 'K']) - sum(1 for aa in fd_seq if aa in ['D', 'E'])
+
+
+def write_fd_cache(fd_name, fd_seq, cache_dir, fd_caps=False):
+    fd_dir = os.path.join(cache_dir, fd_name)
+    os.makedirs(fd_dir, exist_ok=True)
+
+    with open(os.path.join(fd_dir, 'fd_seq.in'), 'w') as out:
+        out.write(fd_sequence_block(fd_seq, fd_caps))
+
+    with open(os.path.join(fd_dir, 'fd_psw.txt'), 'w') as out:
+        out.write(f'{fixed_line}\n' * len(fd_seq))
+
+    with open(os.path.join(fd_dir, 'fd_charge.txt'), 'w') as out:
+        out.write(f'{fd_net_charge(fd_seq)}\n')
+
+    return fd_dir
+
+
+def write_fd_grid(start_pdb, fixed_res_file, cache_file, local_file='fd_grid.npz', idr_first=False, cutoff=4.5):
+    import mdtraj as md
+    from fd_idr_interface_contacts import (read_fixed_residues, get_fd_idr_atoms, split_fd_atoms, build_fd_grid,
+                                           save_fd_grid, load_fd_grid)
+
+    start = md.load(start_pdb)
+    idr_fixed = read_fixed_residues(fixed_res_file)
+    fd_atoms, fd_atom_res, _, _ = get_fd_idr_atoms(start.top, len(idr_fixed), idr_first)
+    # Only the FD backbone is fixed; side chains are read per frame by the analysis scripts
+    fd_atoms, fd_atom_res, _, _ = split_fd_atoms(start.top, fd_atoms, fd_atom_res)
+    fd_xyz = start.xyz[0, fd_atoms] * 10
+
+    if not os.path.exists(cache_file):
+        save_fd_grid(build_fd_grid(fd_xyz, fd_atom_res, cutoff), cache_file)
+    elif load_fd_grid(cache_file, fd_xyz, fd_atom_res, cutoff) is None:
+        print(f'FD coordinates differ from {cache_file}, writing local {local_file}')
+        save_fd_grid(build_fd_grid(fd_xyz, fd_atom_res, cutoff), local_file)
+        return local_file
+
+    if os.path.lexists(local_file):
+        os.remove(local_file)
+    os.symlink(os.path.relpath(cache_file, os.path.dirname(os.path.abspath(local_file))), local_file)
+
+    return cache_file
+
+
+## --------------------- MAIN --------------------- ##
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='precompute FD-side build inputs once per FD')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sequence = subparsers.add_parser('sequence', help='write FD seq.in block, PSW lines and charge for every FD')
+    sequence.add_argument('fd_seqfile', type=str, help='FD sequence file (one FD per line)')
+    sequence.add_argument('cache_dir', type=str, help='output directory (one subdirectory per FD)')
+    sequence.add_argument('--fd-caps', action='store_true', help='cap FD with ACE and NME')
+
+    grid = subparsers.add_parser('grid', help='build (or reuse) the FD contact grid from a CAMPARI start PDB')
+    grid.add_argument('pdb', type=str, help='CAMPARI start PDB (__START.pdb)')
+    grid.add_argument('fixed_res_file', type=str, help='single line IDR fixed residues file')
+    grid.add_argument('cache_file', type=str, help='shared grid file for this FD (fd_cache/<FD_name>/fd_grid.npz)')
+    grid.add_argument('--local', type=str, default='fd_grid.npz',
+                      help='grid file (or link to the shared grid) in the current build (default=fd_grid.npz)')
+    grid.add_argument('--idr-first', action='store_true', help='flag if IDR is first chain in PDB')
+    grid.add_argument('--cutoff', type=float, default=4.5,
+                      help='heavy atom contact distance in Angstroms (default=4.5)')
+    args = parser.parse_args()
+
+    if args.command == 'sequence':
+        with open(args.fd_seqfile) as f:
+            lines = [x.strip().split() for x in f if x.strip()]
+
+        names = [line[0] for line in lines]
+        if len(set(names)) != len(names):
+            raise Exception(f'Duplicate FD names in {args.fd_seqfile}')
+
+        for line in lines:
+            write_fd_cache(line[0], line[1], args.cache_dir, args.fd_caps)
+
+    else:
+        write_fd_grid(args.pdb, args.fixed_res_file, args.cache_file, local_file=args.local,
+                      idr_first=args.idr_first, cutoff=args.cutoff)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+'''
+validate_campaign.py
+
+Pre-flight check of all build inputs for build_FD_IDR_sim_infrastructure_v1.sh,
+run in one process before any directory is built or any cluster time is spent.
+Catches the input mistakes that otherwise still run, just not with the chains
+bound. For every IDR x FD pairing it checks that:
+
+    - the IDR has a fixed residues mask of the same length, made of 0/1, with a motif
+    - IDR and FD sequences only contain the 20 standard amino acids
+    - the PDB exists, has no ACE/NME caps and no HID/HIP/HSD/HSE/HSP histidines
+      (only HIS/HIE, which the builder renames to HIE)
+    - chain order agrees with --idr-first: the FD chain matches the FD sequence and
+      the IDR chain contains exactly the fixed (motif) residues
+    - the motif has at least one CA-CA contact with the FD below the dres.in cutoff
+
+Each PDB is parsed once (by fixed PDB columns) no matter how many variants use it.
+
+Usage:
+
+> python validate_campaign.py IDR_variants.isf fixed_residues.txt FD.isf pdb_structures.txt --idr-first
+
+'''
+
+import os
+import sys
+import argparse
+import numpy as np
+from collections import Counter
+
+## --------------------- Functions --------------------- ##
+AA_3TO1 = {'ALA': 'A', 'CYS': 'C', 'ASP': 'D', 'GLU': 'E', 'PHE': 'F', 'GLY': 'G', 'HIS': 'H',
+           'HIE': 'H', 'ILE': 'I', 'LYS': 'K', 'LEU': 'L', 'MET': 'M', 'ASN': 'N', 'PRO': 'P',
+           'GLN': 'Q', 'ARG': 'R', 'SER': 'S', 'THR': 'T', 'VAL': 'V', 'TRP': 'W', 'TYR': 'Y'}
+CAP_RESIDUES = ['ACE', 'NME', 'NH2']
+BAD_HISTIDINES = ['HID', 'HIP', 'HSD', 'HSE', 'HSP']
+VALID_AA = set('ACDEFGHIKLMNPQRSTVWY')
+
+
+def read_isf(fname):
+    # Whitespace separated <name> <value> lines, in file order
+    entries = []
+    with open(fname) as f:
+        for line in f:
+            line = line.strip().split()
+            if len(line) >= 2:
+                entries.append((line[0], line[1]))
+    return entries
+
+
+def parse_pdb(pdbfile):
+    '''
+    Parse the ATOM records of the first model into per-residue arrays.
+
+    Columns are read by position, so this also works when fields run together.
+    Returns a dict with per-chain residue names and CA coordinates, in file order.
+    '''
+    chains = {}
+    order = []
+    with open(pdbfile) as f:
+        for line in f:
+            record = line[:6].strip()
+            if record == 'ENDMDL':
+                break
+            if record not in ['ATOM', 'HETATM']:
+                continue
+
+            chain = line[21]
+            res_id = line[22:27]
+            if chain not in chains:
+                chains[chain] = {'resnames': [], 'res_ids': [], 'ca': {}}
+                order.append(chain)
+            c = chains[chain]
+            if len(c['res_ids']) == 0 or c['res_ids'][-1] != res_id:
+                c['resnames'].append(line[17:20].strip())
+                c['res_ids'].append(res_id)
+            if line[12:16].strip() == 'CA':
+                c['ca'][len(c['res_ids']) - 1] = [float(line[30:38]), float(line[38:46]), float(line[46:54])]
+
+    return {'order': order, 'chains': chains}
+
+
+def chain_sequence(chain):
+    return ''.join(AA_3TO1.get(r, 'X') for r in chain['resnames'])
+
+
+def motif_contacts(pdb, idr_chain, fd_chain, cutoff=8.0):
+    # Number of motif x FD CA pairs within the dres.in cutoff (as in create_restraint_file.py)
+    idr_ca = np.array(list(pdb['chains'][idr_chain]['ca'].values())).reshape(-1, 3)
+    fd_ca = np.array(list(pdb['chains'][fd_chain]['ca'].values())).reshape(-1, 3)
+    d = np.sqrt(np.sum((idr_ca[:, None, :] - fd_ca[None, :, :])**2, axis=2))
+    return int(np.sum(d < cutoff))
+
+
+def check_pdb(pdbfile, idr_first, contact_cutoff=8.0):
+    '''
+    Checks that only depend on the PDB, so they are done once per file.
+
+    Returns a dict with the errors, the IDR/FD chain sequences and the number of
+    motif-FD CA contacts.
+    '''
+    pdb = parse_pdb(pdbfile)
+    res = {'errors': [], 'idr_seq': None, 'fd_seq': None, 'n_contacts': 0}
+    resnames = set(r for c in pdb['chains'].values() for r in c['resnames'])
+
+    caps = sorted(resnames.intersection(CAP_RESIDUES))
+    if caps:
+        res['errors'].append(f'PDB contains caps {caps}; remove them (see README)')
+
+    bad_his = sorted(resnames.intersection(BAD_HISTIDINES))
+    if bad_his:
+        res['errors'].append(f'PDB contains {bad_his}; only HIS/HIE are converted to HIE for seq.in')
+
+    if len(pdb['order']) < 2:
+        res['errors'].append(f'PDB has {len(pdb["order"])} chain(s), expected 2')
+        return res
+    if len(pdb['order']) > 2:
+        res['errors'].append(f'PDB has {len(pdb["order"])} chains ({pdb["order"]}), expected 2')
+
+    if idr_first:
+        idr_chain, fd_chain = pdb['order'][0], pdb['order'][1]
+    else:
+        idr_chain, fd_chain = pdb['order'][1], pdb['order'][0]
+
+    res['idr_chain'], res['fd_chain'] = idr_chain, fd_chain
+    res['idr_seq'] = chain_sequence(pdb['chains'][idr_chain])
+    res['fd_seq'] = chain_sequence(pdb['chains'][fd_chain])
+    res['n_contacts'] = motif_contacts(pdb, idr_chain, fd_chain, contact_cutoff)
+
+    return res
+
+
+def validate_campaign(idr_entries, fixed_entries, fd_entries, pdb_entries, idr_first=False, contact_cutoff=8.0):
+    '''
+    Validate every IDR x FD pairing. Returns a dict of {build name: [errors]}
+    (empty lists for pairings that pass).
+    '''
+    fixed = dict(fixed_entries)
+    pdbs = dict(pdb_entries)
+    pdb_checks = {}
+    report = {}
+
+    name_counts = Counter(n for n, _ in idr_entries)
+    duplicates = set(n for n, count in name_counts.items() if count > 1)
+
+    for fd_name, fd_seq in fd_entries:
+        fd_errors = []
+        if set(fd_seq) - VALID_AA:
+            fd_errors.append(f'FD sequence has non-standard residues {sorted(set(fd_seq) - VALID_AA)}')
+
+        for idr_name, idr_seq in idr_entries:
+            name = f'{idr_name}_{fd_name}'
+            errors = list(fd_errors)
+            if idr_name in duplicates:
+                errors.append(f'IDR name {idr_name} appears more than once')
+            if set(idr_seq) - VALID_AA:
+                errors.append(f'IDR sequence has non-standard residues {sorted(set(idr_seq) - VALID_AA)}')
+
+            # Fixed residues mask
+            mask = fixed.get(idr_name)
+            if mask is None:
+                errors.append('no fixed residues entry')
+            elif len(mask) != len(idr_seq):
+                errors.append(f'fixed residues length {len(mask)} != IDR length {len(idr_seq)}')
+            elif set(mask) - set('01'):
+                errors.append('fixed residues must only contain 0 and 1')
+            elif '1' not in mask:
+                errors.append('no fixed (motif) residues')
+
+            # PDB, looked up the same way as the builder
+            pdbfile = pdbs.get(name, pdbs.get(idr_name))
+            if pdbfile is None:
+                errors.append('no PDB structure entry')
+            elif not os.path.exists(pdbfile):
+                errors.append(f'PDB does not exist: {pdbfile}')
+            else:
+                if pdbfile not in pdb_checks:
+                    pdb_checks[pdbfile] = check_pdb(pdbfile, idr_first, contact_cutoff)
+                pdb = pdb_checks[pdbfile]
+                errors.extend(pdb['errors'])
+
+                if pdb['fd_seq'] is not None:
+                    if pdb['fd_seq'] != fd_seq:
+                        if pdb['idr_seq'] == fd_seq:
+                            errors.append(f'chain order does not match --idr-first={idr_first}')
+                        else:
+                            errors.append(f'FD chain {pdb["fd_chain"]} sequence does not match {fd_name}')
+
+                    elif mask is not None and len(mask) == len(idr_seq):
+                        motif = ''.join(aa for aa, state in zip(idr_seq, mask) if state == '1')
+                        if pdb['idr_seq'] != motif:
+                            errors.append(f'IDR chain {pdb["idr_chain"]} residues ({pdb["idr_seq"]}) are not '
+                                          f'exactly the fixed residues ({motif})')
+                        elif pdb['n_contacts'] == 0:
+                            errors.append(f'no motif-FD CA contacts below {contact_cutoff} A; dres.in would be empty')
+
+            report[name] = errors
+
+    return report
+
+
+## --------------------- MAIN --------------------- ##
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='validate all campaign inputs before building')
+    parser.add_argument('idr_seqfile', type=str, help='IDR sequence file (one IDR per line)')
+    parser.add_argument('fixed_res_file', type=str, help='fixed IDR residues file (one IDR per line)')
+    parser.add_argument('fd_seqfile', type=str, help='FD sequence file (one FD per line)')
+    parser.add_argument('pdb_list_file', type=str, help='PDB structure list file')
+    parser.add_argument('--idr-first', action='store_true', help='flag if IDR is first chain in PDB')
+    parser.add_argument('--contact-cutoff', type=float, default=8.0,
+                        help='CA-CA distance in Angstroms used for dres.in contacts (default=8.0)')
+    parser.add_argument('--quiet', '-q', action='store_true', help='only print failing pairings')
+    args = parser.parse_args()
+
+    report = validate_campaign(read_isf(args.idr_seqfile), read_isf(args.fixed_res_file),
+                               read_isf(args.fd_seqfile), read_isf(args.pdb_list_file),
+                               idr_first=args.idr_first, contact_cutoff=args.contact_cutoff)
+
+    n_failed = 0
+    for name, errors in report.items():
+        if errors:
+            n_failed += 1
+            for e in errors:
+                print(f'FAIL {name}: {e}')
+        elif not args.quiet:
+            print(f'OK   {name}')
+
+    print(f'{len(report) - n_failed}/{len(report)} pairings passed validation')
+    if n_failed:
+        sys.exit(1)